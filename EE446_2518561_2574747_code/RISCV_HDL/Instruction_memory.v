@@ -5,8 +5,13 @@ output [(BYTE_SIZE*8)-1:0] RD
 
 reg [7:0] mem [1023:0];
 
+// image file, can be overridden with +program=<file>
+reg [8*256-1:0] program_file;
+
 initial begin
-$readmemh("Instructions.hex", mem, 0); // You will need this for real tests
+if (!$value$plusargs("program=%s", program_file))
+  program_file = "Instructions.hex";
+$readmemh(program_file, mem, 0); // You will need this for real tests
 end
 
 genvar i;
@@ -1,4 +1,7 @@
-module RISCV_Computer (
+module RISCV_Computer #(
+  // clk_100MHz cycles per UART bit
+  parameter BAUD_CLK_CYCLES = 10416
+) (
   input  wire        clk,
   input  wire        clk_100MHz,
   input  wire        reset,
@@ -9,7 +12,7 @@ module RISCV_Computer (
   output wire [31:0] PC,
   output wire [31:0] Debug_out,
   output wire tx,
-  output wire rx
+  input  wire rx
 );
 
 
@@ -65,7 +68,7 @@ wire send_req ;
 wire [31:0] ALUResult ;
 
 // DATAPATH
-RISCV_Datapath datapath (
+RISCV_Datapath #(.BAUD_CLK_CYCLES(BAUD_CLK_CYCLES)) datapath (
 // datapath inputs
 .clk                   (clk),
 .clk_100MHz            (clk_100MHz),
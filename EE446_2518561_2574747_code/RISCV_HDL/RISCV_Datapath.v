@@ -1,4 +1,7 @@
-module RISCV_Datapath (
+module RISCV_Datapath #(
+    // clk_100MHz cycles per UART bit
+    parameter BAUD_CLK_CYCLES = 10416
+) (
     input  wire        clk,
     input  wire        clk_100MHz,
     input  wire        reset,
@@ -254,7 +257,7 @@ Register_reset #(.WIDTH(9)) transmitter_register (
 
 
 // UART Receiver instantiation
-UART_Receiver receiver_inst (
+UART_Receiver #(.BAUD_CLK_CYCLES(BAUD_CLK_CYCLES)) receiver_inst (
   .clk      (clk_100MHz),
   .rx       (rx),
   .rx_byte  (rx_byte_sig),
@@ -277,7 +280,7 @@ UART_FIFO fifo_inst (
 
 
 // UART Transmitter instantiation
-UART_Transmitter transmitter_inst (
+UART_Transmitter #(.BAUD_CLK_CYCLES(BAUD_CLK_CYCLES)) transmitter_inst (
   .clk      (clk_100MHz),
   .send_req (send_req_TX),
   .tx_byte  (tx_byte_TX),
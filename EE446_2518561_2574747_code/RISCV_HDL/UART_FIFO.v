@@ -53,7 +53,7 @@ always @(posedge clk) begin
 	
 	if ((data_clk == 2'b10) && (rd_en == 1'b1) && (!fifo_empty) ) begin
 	
-		read_index = read_index +1;
+		read_index <= read_index +1;
 	
 	end
 		
@@ -1,13 +1,13 @@
-module UART_Receiver (
+module UART_Receiver #(
+    // Number of clock cycles per bit period
+    parameter integer BAUD_CLK_CYCLES = 10416
+) (
     input  wire       clk,
     input  wire       rx,
     output reg  [7:0] rx_byte,
     output reg        rx_valid
 );
 
-localparam integer BAUD_CLK_CYCLES  = 10416;
-
-
 // Receiver state machine
 parameter IDLE      = 2'b00;
 parameter START = 2'b01;
@@ -1,4 +1,7 @@
-module UART_Transmitter (
+module UART_Transmitter #(
+    // Number of clock cycles per bit period
+    parameter integer BAUD_CLK_CYCLES = 10416
+) (
     input  wire       clk,
     input  wire       send_req,
     input  wire [7:0] tx_byte,
@@ -7,9 +10,6 @@ module UART_Transmitter (
     output reg        busy
 );
 
-// Number of clock cycles per bit period:
-localparam integer BAUD_CLK_CYCLES  = 10416;
-
 // Transmitter state machine states
 parameter IDLE      = 2'b00;
 parameter START = 2'b01;
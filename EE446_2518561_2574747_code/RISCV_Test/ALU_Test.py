@@ -0,0 +1,158 @@
+# ALU_Test.py
+#
+# Unit test of ALU.v (WIDTH=32) on its own. For every ALUControl value a batch of
+# corner-case and random operands is driven through the DUT, the outputs are
+# collected into arrays and checked in bulk against a NumPy reference that computes
+# the whole batch at once:
+#
+#   make alu ALU_VECTORS=100000
+
+import numpy as np
+import cocotb
+from cocotb.triggers import Timer
+
+MASK = 0xFFFFFFFF
+
+#ALUControl encodings of ALU.v
+ALU_CONTROLS = {
+    0b0000: "AND",
+    0b0001: "EXOR",
+    0b0010: "SubtractionAB",
+    0b0011: "SubtractionBA",
+    0b0100: "Addition",
+    0b0101: "Addition_Carry",
+    0b0110: "SubtractionAB_Carry",
+    0b0111: "SubtractionBA_Carry",
+    0b1000: "SIGNED_LESS_THAN",
+    0b1001: "UNSIGNED_LESS_THAN",
+    0b1010: "ASR",
+    0b1011: "LSR",
+    0b1100: "ORR",
+    0b1101: "Move",
+    0b1110: "LSL",
+    0b1111: "Move_Not",
+}
+
+#Operands around the sign, carry and shift amount boundaries
+CORNER_VALUES = [0x00000000, 0x00000001, 0x00000002, 0x0000001F, 0x00000020, 0x00000021,
+                 0x7FFFFFFE, 0x7FFFFFFF, 0x80000000, 0x80000001, 0xFFFFFFFE, 0xFFFFFFFF,
+                 0x55555555, 0xAAAAAAAA, 0x0000FFFF, 0xFFFF0000]
+
+
+def alu_reference(control, a, b, ci):
+    """
+    Computes the ALU outputs for a whole batch.
+
+    :param control: The ALUControl value of the batch.
+    :param a: DATA_A as a uint32 array.
+    :param b: DATA_B as a uint32 array.
+    :param ci: CI as a uint32 array of 0/1.
+    :return: (OUT, CO, OVF, N, Z) as uint32 arrays.
+    """
+    # 64 bit intermediates keep the carry out of bit 31
+    a64 = a.astype(np.uint64)
+    b64 = b.astype(np.uint64)
+    ci64 = ci.astype(np.uint64)
+    not_a = (~a).astype(np.uint64)
+    not_b = (~b).astype(np.uint64)
+    shamt = b & np.uint32(31)
+    zero = np.zeros_like(a)
+    total = None
+    # (first operand, second operand) of the additions, for the overflow flag
+    operands = None
+    name = ALU_CONTROLS[control]
+    if name == "AND":
+        out = a & b
+    elif name == "EXOR":
+        out = a ^ b
+    elif name == "SubtractionAB":
+        total, operands = a64 + not_b + 1, (a, ~b)
+    elif name == "SubtractionBA":
+        total, operands = b64 + not_a + 1, (b, ~a)
+    elif name == "Addition":
+        total, operands = a64 + b64, (a, b)
+    elif name == "Addition_Carry":
+        total, operands = a64 + b64 + ci64, (a, b)
+    elif name == "SubtractionAB_Carry":
+        total, operands = a64 + not_b + ci64, (a, ~b)
+    elif name == "SubtractionBA_Carry":
+        total, operands = b64 + not_a + ci64, (b, ~a)
+    elif name == "SIGNED_LESS_THAN":
+        out = (a.view(np.int32) < b.view(np.int32)).astype(np.uint32)
+    elif name == "UNSIGNED_LESS_THAN":
+        out = (a < b).astype(np.uint32)
+    elif name == "ASR":
+        out = (a.view(np.int32) >> shamt.astype(np.int32)).view(np.uint32)
+    elif name == "LSR":
+        out = a >> shamt
+    elif name == "ORR":
+        out = a | b
+    elif name == "Move":
+        out = b.copy()
+    elif name == "LSL":
+        out = a << shamt
+    else:
+        out = ~b
+    if total is None:
+        co = ovf = zero
+    else:
+        out = (total & np.uint64(MASK)).astype(np.uint32)
+        co = (total >> np.uint64(32)).astype(np.uint32)
+        # Signed overflow: both operands of the addition have the same sign and the result differs
+        x, y = operands
+        ovf = (((x ^ out) & (y ^ out)) >> np.uint32(31)).astype(np.uint32)
+    return out, co, ovf, out >> np.uint32(31), (out == 0).astype(np.uint32)
+
+
+def operand_batch(rng, count):
+    """
+    All pairs of the corner values (with both CI values) followed by `count` random vectors.
+
+    :return: (a, b, ci) uint32 arrays.
+    """
+    corners = np.array(CORNER_VALUES, dtype=np.uint32)
+    a, b, ci = (grid.ravel() for grid in np.meshgrid(corners, corners, np.array([0, 1], dtype=np.uint32)))
+    random_a = rng.integers(0, 1 << 32, count, dtype=np.uint64).astype(np.uint32)
+    random_b = rng.integers(0, 1 << 32, count, dtype=np.uint64).astype(np.uint32)
+    # Small shift amounts are as likely as any other in the random half
+    random_b[: count // 4] &= np.uint32(63)
+    random_ci = rng.integers(0, 2, count, dtype=np.uint32)
+    return (np.concatenate([a, random_a]), np.concatenate([b, random_b]), np.concatenate([ci, random_ci]))
+
+
+@cocotb.test()
+async def ALU_Test(dut):
+    count = int(cocotb.plusargs.get('alu_vectors', 16384))
+    rng = np.random.default_rng(cocotb.RANDOM_SEED)
+    data_a, data_b, carry_in = dut.DATA_A, dut.DATA_B, dut.CI
+    outputs = (dut.OUT, dut.CO, dut.OVF, dut.N, dut.Z)
+    names = ("OUT", "CO", "OVF", "N", "Z")
+    settle = Timer(1, 'ns')
+    failures = 0
+    total = 0
+    for control, name in ALU_CONTROLS.items():
+        a, b, ci = operand_batch(rng, count)
+        expected = alu_reference(control, a, b, ci)
+        # -1 marks an output that was not a valid 0/1 value
+        actual = np.empty((len(outputs), len(a)), dtype=np.int64)
+        dut.control.value = control
+        for i, (x, y, c) in enumerate(zip(a.tolist(), b.tolist(), ci.tolist())):
+            data_a.value = x
+            data_b.value = y
+            carry_in.value = c
+            await settle
+            for j, handle in enumerate(outputs):
+                value = handle.value
+                actual[j, i] = value.integer if value.is_resolvable else -1
+        # Bulk check of the whole batch, only the first mismatches are reported
+        wrong = np.zeros(len(a), dtype=bool)
+        for j, output in enumerate(names):
+            mismatch = actual[j] != expected[j].astype(np.int64)
+            wrong |= mismatch
+            for i in np.flatnonzero(mismatch)[:5]:
+                dut._log.error("%s %s: A=0x%08x B=0x%08x CI=%d expected 0x%x got %s", name, output, a[i], b[i],
+                               ci[i], expected[j][i], "x" if actual[j, i] < 0 else "0x%x" % actual[j, i])
+        failures += int(wrong.sum())
+        total += len(a)
+        dut._log.info("%-20s %d vectors, %d mismatches", name, len(a), int(wrong.sum()))
+    assert failures == 0, "%d of %d vectors mismatched" % (failures, total)
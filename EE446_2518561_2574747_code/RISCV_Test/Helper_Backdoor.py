@@ -0,0 +1,76 @@
+# Helper_Backdoor.py
+#
+# Reads and writes the architectural state of RISCV_Computer directly through the
+# simulator handles, without executing instructions. Writes are deposits: call
+# them while clk is low, the registers keep the value until the next rising edge
+# loads them again (PC_reg always loads, the register file and memory only when written).
+#
+# The UART (receiver, FIFO, transmitter) and the pipeline registers in front of
+# it are not part of the loaded state, they keep their reset values.
+
+
+def register_handles(dut):
+    """
+    :return: The OUT handles of x1..x31, index 0 is None since x0 is hardwired.
+    """
+    rf = dut.datapath.rf
+    return [None] + [rf.registers[i].Reg.OUT for i in range(1, 32)]
+
+
+def write_registers(dut, registers):
+    """
+    Loads x1..x31 from `registers` (32 values, x0 is ignored).
+    """
+    for handle, value in zip(register_handles(dut)[1:], registers[1:]):
+        handle.value = value & 0xFFFFFFFF
+
+
+def read_registers(dut):
+    return [dut.datapath.rf.Reg_Out[i].value.integer for i in range(32)]
+
+
+def write_pc(dut, pc):
+    dut.datapath.PC_reg.OUT.value = pc & 0xFFFFFFFF
+
+
+def write_memory(mem, data, address=0):
+    """
+    Writes bytes into a byte array memory (Memory.mem or Instruction_memory.mem).
+
+    :param mem: The array handle, e.g. dut.datapath.dmem_read.mem.
+    :param data: A bytes-like object.
+    :param address: Byte address of data[0].
+    """
+    for offset, byte in enumerate(data):
+        mem[address + offset].value = byte
+
+
+def write_word(mem, address, value):
+    """
+    Writes a little endian word into a byte array memory.
+    """
+    write_memory(mem, (value & 0xFFFFFFFF).to_bytes(4, 'little'), address)
+
+
+def read_memory(mem, address, length):
+    return bytes(mem[address + offset].value.integer for offset in range(length))
+
+
+def load_state(dut, pc, registers, data=None, image=None):
+    """
+    Loads a complete architectural state, e.g. a RISCV_ISS.Snapshot.
+
+    :param pc: Value of PC_reg.
+    :param registers: 32 register values.
+    :param data: Optional data memory content, written from address 0.
+    :param image: Optional instruction memory content, written from address 0.
+    """
+    write_pc(dut, pc)
+    write_registers(dut, registers)
+    # The model memory may be larger than the HDL one
+    if data is not None:
+        mem = dut.datapath.dmem_read.mem
+        write_memory(mem, data[:len(mem)])
+    if image is not None:
+        mem = dut.datapath.imem.mem
+        write_memory(mem, image[:len(mem)])
@@ -0,0 +1,90 @@
+# Helper_Config.py
+#
+# Test configuration. Every option can be given in a JSON file pointed to by
+# RISCV_CONFIG and overridden by an environment variable named RISCV_<OPTION>,
+# e.g. "make RISCV_MAX_CYCLES=5000 RISCV_HALT_ADDRESS=0x3FC".
+
+import json
+import os
+
+DEFAULTS = {
+    # lockstep: run the model every cycle, batch: check against a precomputed trace
+    "check_mode": "lockstep",
+    # batch mode compares the whole register file every N cycles (0 = only at the end)
+    "sweep_interval": 32,
+    # cycle budget of a run
+    "max_cycles": 100000,
+    # size of the model's data memory in bytes (the HDL Memory has 1024)
+    "memory_size": 1024,
+    # cycles executed in the model only, the DUT state is then loaded through the backdoor
+    "fast_forward": 0,
+    # stop when the program jumps back into a loop that no longer changes any state
+    "halt_on_spin": True,
+    # instruction words that end the program (zero word, ECALL, EBREAK)
+    "halt_words": [0x00000000, 0x00000073, 0x00100073],
+    # a store to this address ends the program (None = disabled)
+    "halt_address": None,
+    # functional: UART without timing, cycle: FIFO/receiver/transmitter timing of the HDL
+    "uart_mode": "functional",
+    # clk_100MHz cycles per UART bit, BAUD_CLK_CYCLES of UART_Receiver/UART_Transmitter
+    "uart_baud_clk_cycles": 10416,
+    # clk_100MHz cycles per CPU clock cycle, the testbench drives clk_100MHz at this ratio
+    "uart_clock_ratio": 10,
+    # off, mismatch, instruction or signal, see Helper_Trace
+    "trace_level": "mismatch",
+    # number of cycles dumped when a check fails
+    "trace_depth": 16,
+    # JSON file the first mismatch (cycle, PC) is written to, "" = none, see RISCV_Wave_Window
+    "mismatch_report": "",
+    # file the performance counters of the model are written to, .json or .csv, "" = not counted
+    "counters": "",
+}
+
+
+def _parse(text, default):
+    """
+    Converts an environment variable string to the type of the default value.
+    """
+    if isinstance(default, bool):
+        return text.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, list):
+        return [int(item, 0) for item in text.split(",") if item.strip()]
+    if default is None:
+        return int(text, 0) if text.strip() else None
+    if isinstance(default, int):
+        # An empty value leaves the option at its default, only None options can be unset
+        return int(text, 0) if text.strip() else default
+    return text
+
+
+class TestConfig:
+    def __init__(self, **values):
+        for key, default in DEFAULTS.items():
+            setattr(self, key, values.pop(key, default))
+        if values:
+            raise ValueError("Unknown configuration options: " + ", ".join(sorted(values)))
+
+    @classmethod
+    def load(cls, filename=None, environ=None):
+        """
+        Reads the configuration file (if any) and applies the environment overrides.
+
+        :param filename: JSON configuration file, defaults to $RISCV_CONFIG.
+        :param environ: Environment mapping, defaults to os.environ.
+        :return: A TestConfig.
+        """
+        environ = os.environ if environ is None else environ
+        values = {}
+        filename = filename or environ.get("RISCV_CONFIG")
+        if filename:
+            with open(filename, 'r') as file:
+                values.update(json.load(file))
+            # Allow hex strings such as "0x400" in the file
+            for key, value in values.items():
+                if isinstance(value, str) and key in DEFAULTS and not isinstance(DEFAULTS[key], str):
+                    values[key] = _parse(value, DEFAULTS[key])
+        for key, default in DEFAULTS.items():
+            text = environ.get("RISCV_" + key.upper())
+            if text is not None:
+                values[key] = _parse(text, default)
+        return cls(**values)
@@ -0,0 +1,190 @@
+# Helper_Counters.py
+#
+# Architectural performance counters of the model: instruction mix, branch outcomes
+# per PC, load/store address heatmaps of the data memory, UART accesses and the
+# hot PCs. They are attached with RISCV_ISS.enable_counters(), which wraps the
+# decoded entries of the ISS in counting handlers. Without counters the ISS runs
+# its usual entries, so there is no cost when they are disabled.
+#
+#   python RISCV_ISS.py firmware.s --counters profile.json
+#   make RISCV_COUNTERS=profile.csv
+
+import csv
+import json
+import os
+from collections import Counter
+from Helper_lib import mnemonic_of
+from Helper_Devices import UART, UART_EMPTY
+
+MASK = 0xFFFFFFFF
+
+#Tables written by write_csv(), <stem>_<table>.csv each
+CSV_TABLES = ["mix", "pcs", "branches", "memory", "uart"]
+
+
+def mnemonic(ins):
+    """
+    :return: The mnemonic of a decoded Instruction, "unknown" if the model does not decode it.
+    """
+    return mnemonic_of(ins) or "unknown"
+
+
+class PerformanceCounters:
+    """
+    Event counts of one run. Executions are counted per PC, the instruction mix and
+    the hot PC histogram are both derived from them when reported.
+    """
+    def __init__(self, granularity=4):
+        """
+        :param granularity: Bytes per bucket of the load/store heatmaps (a power of 2).
+        """
+        if granularity <= 0 or granularity & (granularity - 1):
+            raise ValueError("Heatmap granularity must be a power of 2, not %d" % granularity)
+        self.granularity = granularity
+        self.bucket_mask = MASK & ~(granularity - 1)
+        #PC -> executions, PC -> Instruction
+        self.executed = Counter()
+        self.instructions = {}
+        #PC -> [not taken, taken]
+        self.branches = {}
+        #Bucket address -> accesses, device accesses are not included
+        self.loads = Counter()
+        self.stores = Counter()
+        #Highest data memory address touched + 1, sizes the memory a program needs
+        self.memory_high_water = 0
+        self.uart = {"loads": 0, "empty_loads": 0, "stores": 0, "max_fifo_level": 0}
+
+    def wrap(self, entry, pc, iss):
+        """
+        Builds the counting version of a decoded (handler, instruction, operation) entry
+        of `iss`. The instruction kind is decided here, so each wrapper does only the
+        work of its own kind.
+        """
+        handler, ins, operation = entry
+        executed = self.executed
+        self.instructions[pc] = ins
+        opcode = ins.opcode
+
+        if opcode == 0x63:
+            outcomes = self.branches.setdefault(pc, [0, 0])
+            fall_through = (pc + 4) & MASK
+
+            def counted(ins, operation, pc):
+                executed[pc] += 1
+                target = handler(ins, operation, pc)
+                outcomes[target != fall_through] += 1
+                return target
+        elif opcode == 0x03 or opcode == 0x23:
+            size = operation[0]
+            offset = ins.imm_I if opcode == 0x03 else ins.imm_S
+            heatmap = self.loads if opcode == 0x03 else self.stores
+            ports = iss.bus.loads if opcode == 0x03 else iss.bus.stores
+            regs = iss.regs
+
+            def counted(ins, operation, pc):
+                executed[pc] += 1
+                addr = (regs[ins.rs1] + offset) & MASK
+                device = ports[size].get(addr)
+                if device is None:
+                    heatmap[addr & self.bucket_mask] += 1
+                    if addr + size > self.memory_high_water:
+                        self.memory_high_water = addr + size
+                    return handler(ins, operation, pc)
+                if opcode == 0x23:
+                    self.uart["stores"] += 1
+                    return handler(ins, operation, pc)
+                # The load pops the FIFO, its level is taken before
+                if isinstance(device, UART) and len(device.fifo) > self.uart["max_fifo_level"]:
+                    self.uart["max_fifo_level"] = len(device.fifo)
+                self.uart["loads"] += 1
+                target = handler(ins, operation, pc)
+                if ins.rd and regs[ins.rd] == UART_EMPTY:
+                    self.uart["empty_loads"] += 1
+                return target
+        else:
+            def counted(ins, operation, pc):
+                executed[pc] += 1
+                return handler(ins, operation, pc)
+        return (counted, ins, operation)
+
+    def mix(self):
+        """
+        :return: {mnemonic: executions}, most executed first.
+        """
+        mix = Counter()
+        for pc, count in self.executed.items():
+            mix[mnemonic(self.instructions[pc])] += count
+        return dict(mix.most_common())
+
+    def hot_pcs(self, top=None):
+        """
+        :return: [(PC, executions, mnemonic)] of the `top` most executed PCs (all if None).
+        """
+        return [(pc, count, mnemonic(self.instructions[pc])) for pc, count in self.executed.most_common(top)]
+
+    def report(self, top=32):
+        """
+        :return: All counters as a JSON serializable dict, addresses as hex strings.
+        """
+        instructions = sum(self.executed.values())
+        return {
+            "instructions": instructions,
+            "mix": self.mix(),
+            "hot_pcs": [{"pc": "0x%08x" % pc, "count": count, "mnemonic": name,
+                         "share": count / instructions} for pc, count, name in self.hot_pcs(top)],
+            "branches": [{"pc": "0x%08x" % pc, "mnemonic": mnemonic(self.instructions[pc]),
+                          "taken": taken, "not_taken": not_taken,
+                          "taken_rate": taken / (taken + not_taken) if taken + not_taken else 0.0}
+                         for pc, (not_taken, taken) in sorted(self.branches.items())],
+            "memory": {
+                "granularity": self.granularity,
+                "high_water": self.memory_high_water,
+                "loads": {"0x%08x" % addr: count for addr, count in sorted(self.loads.items())},
+                "stores": {"0x%08x" % addr: count for addr, count in sorted(self.stores.items())},
+            },
+            "uart": dict(self.uart),
+        }
+
+    def write_json(self, filename, top=32):
+        with open(filename, 'w') as file:
+            json.dump(self.report(top), file, indent=2)
+
+    def write_csv(self, filename, top=None):
+        """
+        Writes one CSV file per table of CSV_TABLES next to `filename`, e.g.
+        profile.csv gives profile_mix.csv, profile_pcs.csv, ...
+
+        :return: The names of the written files.
+        """
+        stem = os.path.splitext(filename)[0]
+        tables = {
+            "mix": (["mnemonic", "count"], self.mix().items()),
+            "pcs": (["pc", "count", "mnemonic"],
+                    [("0x%08x" % pc, count, name) for pc, count, name in self.hot_pcs(top)]),
+            "branches": (["pc", "mnemonic", "taken", "not_taken"],
+                         [("0x%08x" % pc, mnemonic(self.instructions[pc]), taken, not_taken)
+                          for pc, (not_taken, taken) in sorted(self.branches.items())]),
+            "memory": (["address", "loads", "stores"],
+                       [("0x%08x" % addr, self.loads[addr], self.stores[addr])
+                        for addr in sorted(set(self.loads) | set(self.stores))]),
+            "uart": (["counter", "value"], self.uart.items()),
+        }
+        written = []
+        for table in CSV_TABLES:
+            header, rows = tables[table]
+            name = "%s_%s.csv" % (stem, table)
+            with open(name, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(header)
+                writer.writerows(rows)
+            written.append(name)
+        return written
+
+    def write(self, filename):
+        """
+        Writes CSV tables for a .csv file name, JSON otherwise.
+        """
+        if filename.lower().endswith(".csv"):
+            return self.write_csv(filename)
+        self.write_json(filename)
+        return [filename]
@@ -0,0 +1,204 @@
+# Helper_Devices.py
+#
+# Memory mapped devices of the performance model. The controller decodes a device
+# access from the address and the access width (LW 0x404 reads the UART FIFO,
+# SB 0x400 starts a UART transmission), so every device port is an
+# (address, size) pair and all other accesses go to the data memory.
+#
+# Devices are advanced lazily: every access passes the current clock cycle and
+# the device catches up with everything that happened since its last access.
+
+from collections import deque
+
+UART_BASE = 0x400
+
+#HDL defaults, see UART_Receiver/UART_Transmitter and UART_FIFO
+UART_BAUD_CLK_CYCLES = 10416
+UART_FIFO_DEPTH = 16
+UART_EMPTY = 0xFFFFFFFF
+
+UART_FUNCTIONAL = "functional"
+UART_CYCLE = "cycle"
+
+
+class DeviceBus:
+    """
+    Address decoder of the memory mapped devices.
+
+    `loads` and `stores` map the access size to an {address: device} table,
+    so the ISS needs a single dict lookup to decide between a device and memory.
+    """
+    def __init__(self):
+        self.devices = []
+        self.loads = {1: {}, 2: {}, 4: {}}
+        self.stores = {1: {}, 2: {}, 4: {}}
+
+    def attach(self, device):
+        """
+        Registers the ports of `device`, overlapping ports raise a ValueError.
+        """
+        for ports, tables in ((device.load_ports, self.loads), (device.store_ports, self.stores)):
+            for address, size in ports:
+                if address in tables[size]:
+                    raise ValueError(f"Device port 0x{address:08x} ({size} bytes) is already mapped")
+        for address, size in device.load_ports:
+            self.loads[size][address] = device
+        for address, size in device.store_ports:
+            self.stores[size][address] = device
+        self.devices.append(device)
+        return device
+
+    def detach(self, device):
+        for address, size in device.load_ports:
+            del self.loads[size][address]
+        for address, size in device.store_ports:
+            del self.stores[size][address]
+        self.devices.remove(device)
+
+    def quiescent(self):
+        """
+        True if no device can change its state without an access of the program.
+        """
+        return all(device.quiescent() for device in self.devices)
+
+    def state(self):
+        """
+        Hashable state of all devices, part of the spin loop detection.
+        """
+        return tuple(device.state() for device in self.devices)
+
+
+class UART:
+    """
+    Model of UART_Receiver, UART_FIFO and UART_Transmitter as seen by the program.
+
+    LW from base+4 returns the oldest received byte (UART_EMPTY if the FIFO is empty)
+    and removes it, SB to base sends a byte. Received bytes are queued with receive().
+
+    functional: received bytes enter the FIFO as soon as there is room and every
+                transmitted byte is captured, no timing is modelled.
+    cycle:      bytes arrive one UART frame after each other, a byte that arrives
+                while the FIFO is full is lost, the registered rd_en pops the FIFO
+                in the cycle after the load and a byte sent while the transmitter
+                is busy is dropped, as in the HDL.
+    """
+    def __init__(self, base=UART_BASE, mode=UART_FUNCTIONAL, baud_clk_cycles=UART_BAUD_CLK_CYCLES,
+                 clock_ratio=10, depth=UART_FIFO_DEPTH):
+        """
+        :param base: Address of the transmit port, the receive port is at base+4.
+        :param mode: UART_FUNCTIONAL or UART_CYCLE.
+        :param baud_clk_cycles: clk_100MHz cycles per bit (BAUD_CLK_CYCLES of the HDL).
+        :param clock_ratio: clk_100MHz cycles per CPU clock cycle.
+        :param depth: FIFO depth.
+        """
+        if mode not in (UART_FUNCTIONAL, UART_CYCLE):
+            raise ValueError("Unknown UART mode " + repr(mode))
+        self.tx_address = base
+        self.rx_address = base + 4
+        self.load_ports = [(self.rx_address, 4)]
+        self.store_ports = [(self.tx_address, 1)]
+        self.cycle_accurate = mode == UART_CYCLE
+        self.baud_clk_cycles = baud_clk_cycles
+        self.clock_ratio = clock_ratio
+        self.depth = depth
+        self.fifo = deque()
+        #Bytes not yet in the FIFO, (arrival cycle, byte) pairs in cycle mode
+        self.rx_pending = deque()
+        #Cycle of the delayed FIFO pop of the last load (cycle mode)
+        self.pop_cycle = None
+        #clk_100MHz time at which the rx line and the transmitter are free again (cycle mode)
+        self.rx_line_free = 0
+        self.tx_free = 0
+        self.cycle = 0
+        self.received = 0
+        self.rx_dropped = 0
+        self.transmitted = bytearray()
+        self.tx_dropped = 0
+
+    def frame_clocks(self):
+        # start bit, 8 data bits and stop bit
+        return 10 * self.baud_clk_cycles
+
+    def receive(self, data, cycle=None):
+        """
+        Queues bytes to be received, in cycle mode they are sent back to back
+        starting at `cycle` (default: the last cycle the UART was accessed).
+        """
+        if not self.cycle_accurate:
+            self.rx_pending.extend(data)
+            self.refill()
+            return
+        baud = self.baud_clk_cycles
+        # The receiver samples the middle of the bits and latches the byte in the
+        # stop bit, the FIFO stores it on the following edge
+        latency = 2 + (baud - baud // 2) + 9 * baud
+        start = max(self.rx_line_free, (self.cycle if cycle is None else cycle) * self.clock_ratio)
+        for byte in data:
+            arrival = -(-(start + latency) // self.clock_ratio)
+            self.rx_pending.append((arrival, byte))
+            start += self.frame_clocks()
+        self.rx_line_free = start
+
+    def refill(self):
+        while self.rx_pending and len(self.fifo) < self.depth:
+            self.fifo.append(self.rx_pending.popleft())
+            self.received += 1
+
+    def advance(self, cycle):
+        """
+        Applies the FIFO writes and the delayed pop up to (including) `cycle`.
+        """
+        self.cycle = cycle
+        pending = self.rx_pending
+        pop = self.pop_cycle
+        while pending and pending[0][0] <= cycle:
+            arrival, byte = pending.popleft()
+            if pop is not None and pop < arrival:
+                self.fifo.popleft()
+                pop = None
+            # fifo_full is evaluated before a pop of the same edge
+            if len(self.fifo) < self.depth:
+                self.fifo.append(byte)
+                self.received += 1
+            else:
+                self.rx_dropped += 1
+        if pop is not None and pop <= cycle:
+            self.fifo.popleft()
+            pop = None
+        self.pop_cycle = pop
+
+    def load(self, address, cycle):
+        if not self.cycle_accurate:
+            if not self.fifo:
+                return UART_EMPTY
+            value = self.fifo.popleft()
+            self.refill()
+            return value
+        self.advance(cycle)
+        if not self.fifo:
+            return UART_EMPTY
+        self.pop_cycle = cycle + 1
+        return self.fifo[0]
+
+    def store(self, address, value, cycle):
+        value &= 0xFF
+        if not self.cycle_accurate:
+            self.transmitted.append(value)
+            return
+        self.advance(cycle)
+        # send_req is registered, the transmitter sees it in the next cycle
+        start = (cycle + 1) * self.clock_ratio
+        if start < self.tx_free:
+            self.tx_dropped += 1
+            return
+        self.transmitted.append(value)
+        self.tx_free = start + self.frame_clocks() + 1
+
+    def quiescent(self):
+        # Functional pending bytes only move on a load, timed arrivals happen on their own
+        return not self.cycle_accurate or not self.rx_pending
+
+    def state(self):
+        # What the program can read back. Transmitted bytes never return into the
+        # architectural state, so a loop that only sends still counts as a spin.
+        return (tuple(self.fifo), len(self.rx_pending), self.pop_cycle is not None)
@@ -1,5 +1,6 @@
 # Helper_Student.py
 
+import logging
 from cocotb.binary import BinaryValue
 
 def ToHex(value):
@@ -15,6 +16,8 @@ def Log_Datapath(dut, logger):
     Called before each clock edge to log datapath signals.
     Uncomment the lines you need.
     """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug("********** DUT DATAPATH SIGNALS **********")
     # logger.debug("PC           = %s", ToHex(dut.PC.value))
     # logger.debug("Instr        = %s", ToHex(dut.Instr.value))
@@ -45,6 +48,8 @@ def Log_Controller(dut, logger):
     Called before each clock edge to log controller signals.
     Uncomment the lines you need.
     """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug("********** DUT CONTROLLER SIGNALS **********")
     logger.debug("MemWrite    = %s", ToHex(dut.controller.MemWrite.value))
     logger.debug("RegWrite    = %s", ToHex(dut.controller.RegWrite.value))
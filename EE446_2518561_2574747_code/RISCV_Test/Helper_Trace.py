@@ -0,0 +1,97 @@
+# Helper_Trace.py
+#
+# Verbosity tiers of the testbench. Nothing is read from the simulator and no
+# message is formatted unless its tier is enabled:
+#   off         - no tracing at all
+#   mismatch    - keep the last `depth` cycles in a ring buffer, dump them on a failure
+#   instruction - also log every instruction and the PC/register comparison
+#   signal      - also log and record the datapath/controller signals every cycle
+
+import logging
+from collections import deque
+from Helper_Student import ToHex
+
+TRACE_OFF = 0
+TRACE_MISMATCH = 1
+TRACE_INSTRUCTION = 2
+TRACE_SIGNAL = 3
+
+TRACE_LEVELS = {
+    "off": TRACE_OFF,
+    "mismatch": TRACE_MISMATCH,
+    "instruction": TRACE_INSTRUCTION,
+    "signal": TRACE_SIGNAL,
+}
+
+#Signals recorded in the ring buffer at the signal tier, relative to the toplevel
+SIGNALS = [
+    "datapath.Instr",
+    "datapath.ALUResult",
+    "datapath.ReadData",
+    "datapath.LoadData",
+    "datapath.WriteData",
+    "datapath.rd_data",
+    "datapath.fifo_empty",
+    "controller.MemWrite",
+    "controller.RegWrite",
+]
+
+
+def sample_signals(dut, names):
+    """
+    Reads the given signals of the DUT.
+
+    :param dut: The toplevel handle.
+    :param names: Dotted signal paths relative to the toplevel.
+    :return: A list of (name, hex string) pairs.
+    """
+    values = []
+    for name in names:
+        handle = dut
+        for part in name.split('.'):
+            handle = getattr(handle, part)
+        values.append((name, ToHex(handle.value)))
+    return values
+
+
+class Tracer:
+    def __init__(self, logger, level="mismatch", depth=16, signals=SIGNALS):
+        """
+        :param logger: The testbench logger, its level is set from the tier.
+        :param level: One of TRACE_LEVELS (name or value).
+        :param depth: Number of cycles kept in the ring buffer.
+        :param signals: Signals sampled at the signal tier.
+        """
+        self.logger = logger
+        self.level = TRACE_LEVELS[level] if isinstance(level, str) else level
+        self.signals = signals
+        #Ring buffer of [cycle, PC, next PC, registers, signals] entries
+        self.history = deque(maxlen=depth) if self.level >= TRACE_MISMATCH and depth > 0 else None
+        logger.setLevel(logging.DEBUG if self.level >= TRACE_INSTRUCTION else logging.INFO)
+
+    def record(self, cycle, PC, next_PC, registers, signals=None):
+        """
+        Appends one cycle of context, `registers` must be an immutable copy.
+        """
+        self.history.append((cycle, PC, next_PC, registers, signals))
+
+    def dump(self, program):
+        """
+        Logs the cycles kept in the ring buffer, called only when a check fails.
+
+        :param program: The DecodedProgram to disassemble the recorded PCs.
+        """
+        if not self.history:
+            return
+        self.logger.error("************* Last %d cycles before the failure **************", len(self.history))
+        previous = None
+        for cycle, PC, next_PC, registers, signals in self.history:
+            word = program.fetch(PC).word if program.contains(PC) else None
+            self.logger.error("Clock cycle %d: PC:0x%08x Instr:%s -> PC:0x%08x", cycle, PC,
+                              "0x%08x" % word if word is not None else "-", next_PC)
+            for i in range(32):
+                if previous is None and registers[i] != 0 or previous is not None and registers[i] != previous[i]:
+                    self.logger.error("    Register%d <= 0x%x", i, registers[i])
+            for name, value in signals or ():
+                self.logger.error("    %-20s = %s", name, value)
+            previous = registers
@@ -0,0 +1,144 @@
+# Helper_UART.py
+#
+# Byte level UART driver and monitor for the rx/tx pins of RISCV_Computer.
+# Both run as background coroutines that only wake up once per bit, and the bit
+# time follows BAUD_CLK_CYCLES (make BAUD_CLK_CYCLES=16), so byte-stream tests
+# with a shortened bit time run in seconds.
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.queue import Queue
+from cocotb.triggers import Event, FallingEdge, Timer, with_timeout
+
+
+def start_clock(signal, period_ns, phase_ns=0):
+    """
+    Starts a free running clock, optionally delayed by `phase_ns` so that its
+    edges do not coincide with the edges of another clock.
+
+    :return: The clock task.
+    """
+    async def run():
+        if phase_ns:
+            await Timer(phase_ns, 'ns', round_mode='round')
+        await Clock(signal, period_ns, 'ns').start(start_high=False)
+    return cocotb.start_soon(run())
+
+
+class UARTDriver:
+    """
+    Sends bytes on a UART line (8N1, LSB first). The line idles high, bytes
+    written with write() are sent in the background one frame after another.
+    """
+    def __init__(self, signal, bit_time_ns, idle_bits=1):
+        """
+        :param signal: The line driven by the driver (dut.rx).
+        :param bit_time_ns: Duration of one bit, BAUD_CLK_CYCLES clk_100MHz periods.
+        :param idle_bits: Idle bit times after every stop bit.
+        """
+        self.signal = signal
+        self.bit_time_ns = bit_time_ns
+        self.idle_bits = idle_bits
+        self.queue = Queue()
+        self.sent = 0
+        self.idle = Event()
+        self.idle.set()
+        signal.value = 1
+        self.task = cocotb.start_soon(self._run())
+
+    def write(self, data):
+        """
+        Queues `data` (bytes or an iterable of ints) without waiting.
+        """
+        for byte in data:
+            self.queue.put_nowait(byte)
+        if not self.queue.empty():
+            self.idle.clear()
+
+    async def send(self, data):
+        """
+        Queues `data` and waits until the last stop bit has been sent.
+        """
+        self.write(data)
+        await self.idle.wait()
+
+    async def _run(self):
+        bit = Timer(self.bit_time_ns, 'ns', round_mode='round')
+        signal = self.signal
+        while True:
+            byte = await self.queue.get()
+            signal.value = 0
+            await bit
+            for i in range(8):
+                signal.value = (byte >> i) & 1
+                await bit
+            signal.value = 1
+            await bit
+            for _ in range(self.idle_bits):
+                await bit
+            self.sent += 1
+            if self.queue.empty():
+                self.idle.set()
+
+
+class UARTMonitor:
+    """
+    Collects the bytes sent on a UART line (8N1, LSB first), sampling the middle of every bit.
+    """
+    def __init__(self, signal, bit_time_ns):
+        """
+        :param signal: The monitored line (dut.tx).
+        :param bit_time_ns: Duration of one bit, BAUD_CLK_CYCLES clk_100MHz periods.
+        """
+        self.signal = signal
+        self.bit_time_ns = bit_time_ns
+        self.received = bytearray()
+        self.framing_errors = 0
+        self.queue = Queue()
+        self.task = cocotb.start_soon(self._run())
+
+    async def read(self, count, timeout=None, units='us'):
+        """
+        Waits for the next `count` bytes.
+
+        :param timeout: Optional timeout, raises cocotb.result.SimTimeoutError when it expires.
+        :return: The bytes, in the order they were received.
+        """
+        async def collect():
+            return bytes([await self.queue.get() for _ in range(count)])
+        if timeout is None:
+            return await collect()
+        return await with_timeout(collect(), timeout, units)
+
+    async def _run(self):
+        half = Timer(self.bit_time_ns / 2, 'ns', round_mode='round')
+        bit = Timer(self.bit_time_ns, 'ns', round_mode='round')
+        signal = self.signal
+        while True:
+            await FallingEdge(signal)
+            await half
+            # A start bit has to be low in its middle, anything else is a glitch
+            if signal.value.binstr != '0':
+                continue
+            byte = 0
+            for i in range(8):
+                await bit
+                if signal.value.binstr == '1':
+                    byte |= 1 << i
+            await bit
+            if signal.value.binstr != '1':
+                self.framing_errors += 1
+            self.received.append(byte)
+            self.queue.put_nowait(byte)
+
+
+async def stream(driver, monitor, data, count=None, timeout=None, units='us'):
+    """
+    Streams `data` into the rx line and collects the bytes coming out of tx.
+
+    :param count: Number of bytes to collect, defaults to len(data).
+    :param timeout: Optional timeout of the whole transfer.
+    :return: The collected bytes.
+    """
+    driver.write(data)
+    return await monitor.read(len(data) if count is None else count, timeout, units)
@@ -1,3 +1,8 @@
+import mmap
+import os
+import struct
+
+
 def read_file_to_list(filename):
     """
     Reads a text file and returns a list where each element is a line in the file.
@@ -48,10 +53,56 @@ def shift_helper(value, shift,shift_type, n_bits=32):
             return rotate_right(value,shift,n_bits)   #RR
 
 
+#Little endian accessors, they unpack straight out of the memory buffer
+_S8 = struct.Struct('<b')
+_U16 = struct.Struct('<H')
+_S16 = struct.Struct('<h')
+_U32 = struct.Struct('<I')
+
+
 class ByteAddressableMemory:
-    def __init__(self, size):
+    """
+    Little endian byte addressable memory. The typed accessors read and write the
+    underlying buffer in place with struct, without slicing or copying it.
+
+    The buffer is a bytearray, or a memory mapped file when `backing_file` is given,
+    so large data images are paged in by the OS instead of being read into Python.
+    """
+    def __init__(self, size, backing_file=None, writeback=False):
+        """
+        :param size: Size of the memory in bytes.
+        :param backing_file: Optional image file mapped as the initial memory content.
+        :param writeback: Write stores through to `backing_file`, by default the
+                          mapping is copy-on-write and the file is never modified.
+        """
         self.size = size
-        self.memory = bytearray(size)  # Initialize memory as a bytearray of the given size
+        self.mapped = None
+        if backing_file is None:
+            self.memory = bytearray(size)  # Initialize memory as a bytearray of the given size
+        else:
+            with open(backing_file, 'r+b' if writeback else 'rb') as file:
+                file_size = os.fstat(file.fileno()).st_size
+                if writeback and file_size < size:
+                    file.truncate(size)
+                    file_size = size
+                if file_size >= size:
+                    self.mapped = mmap.mmap(file.fileno(), size,
+                                            access=mmap.ACCESS_WRITE if writeback else mmap.ACCESS_COPY)
+                    self.memory = self.mapped
+                else:
+                    # A private mapping cannot be longer than the file, read the short image instead
+                    self.memory = bytearray(size)
+                    file.readinto(memoryview(self.memory)[:file_size])
+        self.view = memoryview(self.memory)
+
+    def close(self):
+        """
+        Releases the memory mapping (if any), flushing it in writeback mode.
+        """
+        self.view.release()
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
 
     def read(self, address):
         if address < 0 or address + 4 > self.size:
@@ -63,63 +114,134 @@ class ByteAddressableMemory:
     def write(self, address, data):
         if address < 0 or address + 4> self.size:
             raise ValueError("Invalid memory address or data length")
-        data_bytes = data.to_bytes(4, byteorder='little')
-        self.memory[address : address + 4] = data_bytes   
+        _U32.pack_into(self.memory, address, data & 0xFFFFFFFF)
+
+    def check(self, address, size):
+        if address < 0 or address + size > self.size:
+            raise ValueError(f"Invalid memory address 0x{address:08x} for a {size} byte access")
+
+    # Loads return the zero or sign extended value, stores truncate the value to the access size
+    def load_byte(self, address):
+        self.check(address, 1)
+        return self.memory[address]
+
+    def load_byte_signed(self, address):
+        self.check(address, 1)
+        return _S8.unpack_from(self.memory, address)[0]
+
+    def load_half(self, address):
+        self.check(address, 2)
+        return _U16.unpack_from(self.memory, address)[0]
+
+    def load_half_signed(self, address):
+        self.check(address, 2)
+        return _S16.unpack_from(self.memory, address)[0]
+
+    def load_word(self, address):
+        self.check(address, 4)
+        return _U32.unpack_from(self.memory, address)[0]
+
+    def store_byte(self, address, value):
+        self.check(address, 1)
+        self.memory[address] = value & 0xFF
+
+    def store_half(self, address, value):
+        self.check(address, 2)
+        _U16.pack_into(self.memory, address, value & 0xFFFF)
+
+    def store_word(self, address, value):
+        self.check(address, 4)
+        _U32.pack_into(self.memory, address, value & 0xFFFFFFFF)
+
+    def load_image(self, data, address=0):
+        """
+        Copies a bytes-like image into the memory starting at `address`.
+        """
+        self.check(address, len(data))
+        self.view[address : address + len(data)] = data
+
+    def load_file(self, filename, address=0):
+        """
+        Reads a binary image file directly into the memory buffer.
+
+        :return: The number of bytes loaded.
+        """
+        with open(filename, 'rb') as file:
+            return file.readinto(self.view[address:])
+
+    def dump(self, address=0, length=None):
+        """
+        Returns a memoryview of the given range, it shares the buffer and is not a copy.
+        """
+        length = self.size - address if length is None else length
+        self.check(address, length)
+        return self.view[address : address + length]
+
+    def save_file(self, filename, address=0, length=None):
+        """
+        Writes the given range of the memory to a binary image file.
+        """
+        with open(filename, 'wb') as file:
+            file.write(self.dump(address, length))
+
+
+def sign_extend(value, bits):
+    """
+    Sign-extend the lowest `bits` bits of `value` to a Python integer.
+
+    :param value: The unsigned field value.
+    :param bits: The width of the field.
+    :return: The signed value.
+    """
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
 
 
 class Instruction:
     """
-    Parses a 32-bit RISC-V instruction encoded as an 8-hex-character string.
+    Parses a 32-bit RISC-V instruction encoded as an 8-hex-character string
+    or as an integer word. Fields are extracted with bit masks.
     """
+    __slots__ = ('word', 'opcode', 'rd', 'funct3', 'rs1', 'rs2', 'funct7', 'funct7_5',
+                 'imm_I', 'imm_S', 'imm_B', 'imm_U', 'imm_J')
+
     def __init__(self, instruction):
-        # Convert the hex instruction to a 32-bit binary_instruction string
-        self.binary_instruction = format(int(instruction, 16), '032b')
-        # Since python indexing is reversed to extract fields (31-index) for msb and (32-index) for lsb
-        # For single bits do (31-index)
-        self.opcode   = int(self.binary_instruction[25:32], 2)
-        self.rd       = int(self.binary_instruction[20:25], 2)
-        self.funct3   = int(self.binary_instruction[17:20], 2)
-        self.rs1      = int(self.binary_instruction[12:17], 2)
-        self.rs2      = int(self.binary_instruction[7:12], 2)
-        self.funct7   = int(self.binary_instruction[0:7], 2)
-        self.funct7_5 = int(self.binary_instruction[1], 2)
-
-        # I-type (bits 31 down to 20, total 12 bits)
-        imm_I = int(self.binary_instruction[0:12], 2)           # top 12 bits
-        if self.binary_instruction[0] == '1':
-            imm_I -= (1 << 12)                      # sign-extend from 12 bits
-        self.imm_I = imm_I
-
-        # S-type immediate (bits 0-6 + 20-24), sign-extend 12 bits
-        imm_S = int(self.binary_instruction[0:7] + self.binary_instruction[20:25], 2)
-        if self.binary_instruction[0] == '1':
-            imm_S -= (1 << 12)
-        self.imm_S = imm_S
-
-        # B-type immediate (bits 0,24,1-7,20-24 <<1), sign-extend 13 bits
-        imm_B = (
-            (int(self.binary_instruction[0],2) << 12) |
-            (int(self.binary_instruction[24],2) << 11) |
-            (int(self.binary_instruction[1:7],2) << 5) |
-            (int(self.binary_instruction[20:24],2) << 1)
-        )
-        if self.binary_instruction[0] == '1':
-            imm_B -= (1 << 13)
-        self.imm_B = imm_B
-
-        # U-type immediate (bits 0-19 <<12)
-        self.imm_U = int(self.binary_instruction[0:20], 2) << 12
-
-        # J-type immediate (bits 0,12-19,11,1-11 <<1), sign-extend 21 bits
-        imm_J = (
-            (int(self.binary_instruction[0],2) << 20) |
-            (int(self.binary_instruction[12:20],2) << 12) |
-            (int(self.binary_instruction[11],2) << 11) |
-            (int(self.binary_instruction[1:11],2) << 1)
-        )
-        if self.binary_instruction[0] == '1':
-            imm_J -= (1 << 21)
-        self.imm_J = imm_J
+        word = instruction if isinstance(instruction, int) else int(instruction, 16)
+        self.word     = word
+        self.opcode   = word & 0x7F
+        self.rd       = (word >> 7) & 0x1F
+        self.funct3   = (word >> 12) & 0x7
+        self.rs1      = (word >> 15) & 0x1F
+        self.rs2      = (word >> 20) & 0x1F
+        self.funct7   = (word >> 25) & 0x7F
+        self.funct7_5 = (word >> 30) & 0x1
+
+        # I-type (bits 31 down to 20), sign-extend 12 bits
+        self.imm_I = sign_extend(word >> 20, 12)
+
+        # S-type immediate (bits 31-25 + 11-7), sign-extend 12 bits
+        self.imm_S = sign_extend(((word >> 20) & 0xFE0) | ((word >> 7) & 0x1F), 12)
+
+        # B-type immediate (bits 31,7,30-25,11-8 <<1), sign-extend 13 bits
+        self.imm_B = sign_extend(
+            ((word >> 19) & 0x1000) |
+            ((word << 4) & 0x800) |
+            ((word >> 20) & 0x7E0) |
+            ((word >> 7) & 0x1E), 13)
+
+        # U-type immediate (bits 31-12 <<12)
+        self.imm_U = word & 0xFFFFF000
+
+        # J-type immediate (bits 31,19-12,20,30-21 <<1), sign-extend 21 bits
+        self.imm_J = sign_extend(
+            ((word >> 11) & 0x100000) |
+            (word & 0xFF000) |
+            ((word >> 9) & 0x800) |
+            ((word >> 20) & 0x7FE), 21)
+
+    @property
+    def binary_instruction(self):
+        return format(self.word, '032b')
 
     def log(self, logger):
         logger.debug("****** RISC-V Instruction Fields ******")
@@ -167,3 +289,193 @@ class Instruction:
         else:
             logger.debug("Wrong Instruction Type")  
 
+
+
+def parse_hex_image(lines):
+    """
+    Converts the lines of a $readmemh style byte image (as read by read_file_to_list)
+    into a bytearray. Supports "@address" directives and "//" comments.
+
+    :param lines: The lines of the hex file.
+    :return: A bytearray holding the image starting from address 0.
+    """
+    image = bytearray()
+    address = 0
+    for line in lines:
+        line = line.split('//')[0]
+        for token in line.split():
+            if token.startswith('@'):
+                address = int(token[1:], 16)
+                continue
+            if address >= len(image):
+                image.extend(bytes(address + 1 - len(image)))
+            image[address] = int(token, 16)
+            address = address + 1
+    return image
+
+
+class DecodedProgram:
+    """
+    PC-indexed table of Instruction objects, decoded once when the program is loaded.
+    Writes into the instruction space go through write() which invalidates the
+    affected entries so that they are decoded again on the next fetch.
+    """
+    def __init__(self, image):
+        self.image = bytearray(image)
+        # Pad to a whole number of words
+        self.image.extend(bytes(-len(self.image) % 4))
+        self.size = len(self.image)
+        self.table = [Instruction(int.from_bytes(self.image[i : i + 4], 'little'))
+                      for i in range(0, self.size, 4)]
+
+    @classmethod
+    def from_hex_lines(cls, lines):
+        return cls(parse_hex_image(lines))
+
+    def __len__(self):
+        return len(self.table)
+
+    def fetch(self, address):
+        """
+        Returns the decoded instruction at byte address `address`.
+        """
+        entry = self.table[address >> 2]
+        if entry is None:
+            entry = Instruction(int.from_bytes(self.image[address & ~3 : (address & ~3) + 4], 'little'))
+            self.table[address >> 2] = entry
+        return entry
+
+    def contains(self, address):
+        return 0 <= address < self.size
+
+    def write(self, address, data):
+        """
+        Self-modifying code hook: updates the image and invalidates the touched words.
+
+        :param address: Byte address of the write.
+        :param data: The bytes written (little endian).
+        """
+        end = min(address + len(data), self.size)
+        if address < 0 or address >= end:
+            return
+        self.image[address : end] = data[: end - address]
+        for index in range(address >> 2, ((end - 1) >> 2) + 1):
+            self.table[index] = None
+
+
+# Instructions decoded by the model: mnemonic -> (format, opcode, funct3, funct7)
+# Format "IS" is the shift-immediate form of the I-type (shamt in imm[4:0], funct7 in imm[11:5])
+INSTRUCTION_SET = {
+    "add":   ("R", 0x33, 0x0, 0x00),
+    "sub":   ("R", 0x33, 0x0, 0x20),
+    "sll":   ("R", 0x33, 0x1, 0x00),
+    "slt":   ("R", 0x33, 0x2, 0x00),
+    "sltu":  ("R", 0x33, 0x3, 0x00),
+    "xor":   ("R", 0x33, 0x4, 0x00),
+    "srl":   ("R", 0x33, 0x5, 0x00),
+    "sra":   ("R", 0x33, 0x5, 0x20),
+    "or":    ("R", 0x33, 0x6, 0x00),
+    "and":   ("R", 0x33, 0x7, 0x00),
+    "addi":  ("I", 0x13, 0x0, None),
+    "slti":  ("I", 0x13, 0x2, None),
+    "sltiu": ("I", 0x13, 0x3, None),
+    "xori":  ("I", 0x13, 0x4, None),
+    "ori":   ("I", 0x13, 0x6, None),
+    "andi":  ("I", 0x13, 0x7, None),
+    "slli":  ("IS", 0x13, 0x1, 0x00),
+    "srli":  ("IS", 0x13, 0x5, 0x00),
+    "srai":  ("IS", 0x13, 0x5, 0x20),
+    "lb":    ("I", 0x03, 0x0, None),
+    "lh":    ("I", 0x03, 0x1, None),
+    "lw":    ("I", 0x03, 0x2, None),
+    "lbu":   ("I", 0x03, 0x4, None),
+    "lhu":   ("I", 0x03, 0x5, None),
+    "sb":    ("S", 0x23, 0x0, None),
+    "sh":    ("S", 0x23, 0x1, None),
+    "sw":    ("S", 0x23, 0x2, None),
+    "beq":   ("B", 0x63, 0x0, None),
+    "bne":   ("B", 0x63, 0x1, None),
+    "blt":   ("B", 0x63, 0x4, None),
+    "bge":   ("B", 0x63, 0x5, None),
+    "bltu":  ("B", 0x63, 0x6, None),
+    "bgeu":  ("B", 0x63, 0x7, None),
+    "jal":   ("J", 0x6f, None, None),
+    "jalr":  ("I", 0x67, 0x0, None),
+    "lui":   ("U", 0x37, None, None),
+    "auipc": ("U", 0x17, None, None),
+}
+
+#(opcode, funct3) pairs where funct7_5 selects the instruction (ADD/SUB, SRL/SRA, SRLI/SRAI),
+#everywhere else the model ignores funct7
+FUNCT7_5_DECODED = frozenset(((0x33, 0x0), (0x33, 0x5), (0x13, 0x5)))
+
+#Opcodes the model decodes without looking at funct3, JALR included
+NO_FUNCT3_OPCODES = frozenset((0x6f, 0x67, 0x37, 0x17))
+
+#(opcode, funct3, funct7_5) -> mnemonic, funct3/funct7_5 are None where they are not decoded
+MNEMONICS = {(opcode, None if opcode in NO_FUNCT3_OPCODES else funct3,
+              funct7 >> 5 if (opcode, funct3) in FUNCT7_5_DECODED else None): name
+             for name, (fmt, opcode, funct3, funct7) in INSTRUCTION_SET.items()}
+
+
+def mnemonic_of(ins):
+    """
+    Returns the mnemonic the model executes a decoded Instruction as, None if the
+    model does not decode it.
+    """
+    funct3 = None if ins.opcode in NO_FUNCT3_OPCODES else ins.funct3
+    funct7_5 = ins.funct7_5 if (ins.opcode, funct3) in FUNCT7_5_DECODED else None
+    return MNEMONICS.get((ins.opcode, funct3, funct7_5))
+
+
+def encode_instruction(mnemonic, rd=0, rs1=0, rs2=0, imm=0):
+    """
+    Encodes one instruction of INSTRUCTION_SET into a 32-bit word.
+
+    :param mnemonic: Lower case mnemonic, e.g. "addi".
+    :param imm: Immediate value; byte offset for B/J, the upper 20 bits for U, shamt for IS.
+    :return: The instruction word.
+    """
+    fmt, opcode, funct3, funct7 = INSTRUCTION_SET[mnemonic]
+    if fmt == "R":
+        return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+    if fmt == "I":
+        if not -2048 <= imm <= 4095:
+            raise ValueError("Immediate %d out of range for %s" % (imm, mnemonic))
+        return ((imm & 0xFFF) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+    if fmt == "IS":
+        if not 0 <= imm <= 31:
+            raise ValueError("Shift amount %d out of range for %s" % (imm, mnemonic))
+        return (funct7 << 25) | (imm << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+    if fmt == "S":
+        if not -2048 <= imm <= 2047:
+            raise ValueError("Immediate %d out of range for %s" % (imm, mnemonic))
+        imm &= 0xFFF
+        return ((imm >> 5) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | ((imm & 0x1F) << 7) | opcode
+    if fmt == "B":
+        if not -4096 <= imm <= 4094 or imm & 1:
+            raise ValueError("Branch offset %d out of range for %s" % (imm, mnemonic))
+        imm &= 0x1FFF
+        return (((imm >> 12) & 1) << 31) | (((imm >> 5) & 0x3F) << 25) | (rs2 << 20) | (rs1 << 15) | \
+               (funct3 << 12) | (((imm >> 1) & 0xF) << 8) | (((imm >> 11) & 1) << 7) | opcode
+    if fmt == "U":
+        if not -(1 << 19) <= imm < (1 << 20):
+            raise ValueError("Immediate %d out of range for %s" % (imm, mnemonic))
+        return ((imm & 0xFFFFF) << 12) | (rd << 7) | opcode
+    if fmt == "J":
+        if not -(1 << 20) <= imm < (1 << 20) or imm & 1:
+            raise ValueError("Jump offset %d out of range for %s" % (imm, mnemonic))
+        imm &= 0x1FFFFF
+        return (((imm >> 20) & 1) << 31) | (((imm >> 1) & 0x3FF) << 21) | (((imm >> 11) & 1) << 20) | \
+               (((imm >> 12) & 0xFF) << 12) | (rd << 7) | opcode
+    raise ValueError("Unknown format " + fmt)
+
+
+def write_hex_image(filename, words):
+    """
+    Writes instruction words in the byte order Instruction_memory reads them
+    ($readmemh, little endian, one instruction per line).
+    """
+    with open(filename, 'w') as file:
+        for word in words:
+            file.write(" ".join("%02x" % b for b in word.to_bytes(4, 'little')) + "\n")
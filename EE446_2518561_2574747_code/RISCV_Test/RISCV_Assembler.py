@@ -0,0 +1,415 @@
+# RISCV_Assembler.py
+#
+# Two pass assembler for the RV32I subset of Helper_lib.INSTRUCTION_SET. It reads
+# the listing format of Instructions_RISCV.txt ("addr: mnemonic operands  encoding",
+# the address and the encoding are optional and checked when present) as well as
+# plain source with labels:
+#
+#   loop:   lw   x5, 0x404(x0)      // poll the UART
+#           beq  x5, x6, loop
+#           sb   x5, #0x400(x0)
+#           j    loop
+#
+# Immediates are decimal or hex with an optional "#", branch and jump targets are
+# labels or byte offsets. Besides the instructions, ".org addr", ".word value" and
+# the pseudo instructions nop, mv, not, neg, j, jr, ret and li are accepted.
+#
+# Assembled programs are kept in an on-disk cache keyed by the SHA-256 of the source,
+# as a $readmemh image for Instruction_memory and a binary image the model loads
+# without parsing hex text, so a source is only assembled again when it changes:
+#
+#   python RISCV_Assembler.py program.s -o program.hex
+#   python RISCV_Assembler.py program.s --print-path      # cached image, used by the Makefile
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+from Helper_lib import DecodedProgram, INSTRUCTION_SET, encode_instruction, read_file_to_list
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#Files with these suffixes are assembled, everything else is read as a hex image
+SOURCE_SUFFIXES = (".s", ".asm", ".txt")
+
+#Part of the cache key, increment when the output for the same source changes
+ASSEMBLER_VERSION = 1
+
+ABI_NAMES = ["zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2", "s0", "s1",
+             "a0", "a1", "a2", "a3", "a4", "a5", "a6", "a7",
+             "s2", "s3", "s4", "s5", "s6", "s7", "s8", "s9", "s10", "s11",
+             "t3", "t4", "t5", "t6"]
+REGISTERS = {name: index for index, name in enumerate(ABI_NAMES)}
+REGISTERS.update(("x%d" % index, index) for index in range(32))
+REGISTERS["fp"] = 8
+
+ADDRESS = re.compile(r"^(0[xX][0-9a-fA-F]+)\s*:")
+LABEL = re.compile(r"^([A-Za-z_.$][\w.$]*)\s*:")
+MEMORY_OPERAND = re.compile(r"^(.*)\(\s*(\w+)\s*\)$")
+
+PSEUDO_INSTRUCTIONS = {"nop", "mv", "not", "neg", "j", "jr", "ret", "li"}
+
+
+class AssemblerError(ValueError):
+    def __init__(self, message, filename, line_number):
+        super().__init__("%s:%d: %s" % (filename, line_number, message))
+
+
+def _register(text):
+    register = REGISTERS.get(text.strip().lower())
+    if register is None:
+        raise ValueError("Unknown register " + text)
+    return register
+
+
+def _number(text):
+    text = text.strip()
+    if text.startswith("#"):
+        text = text[1:]
+    return int(text, 0)
+
+
+def _split_li(value):
+    """
+    Splits a 32 bit constant into the lui and addi immediates of li.
+
+    :return: (upper 20 bits or None, lower 12 bits sign extended)
+    """
+    value &= 0xFFFFFFFF
+    low = ((value & 0xFFF) ^ 0x800) - 0x800
+    if value < 2048 or value >= (1 << 32) - 2048:
+        return None, low
+    # addi sign extends, a negative low part borrows from the upper part
+    return ((value - low) >> 12) & 0xFFFFF, low
+
+
+class _Statement:
+    __slots__ = ('line_number', 'address', 'mnemonic', 'operands', 'expected')
+
+    def __init__(self, line_number, address, mnemonic, operands, expected):
+        self.line_number = line_number
+        self.address = address
+        self.mnemonic = mnemonic
+        self.operands = operands
+        self.expected = expected
+
+    @property
+    def text(self):
+        return " ".join([self.mnemonic, ", ".join(self.operands)]).strip()
+
+
+def _parse_line(line):
+    """
+    Splits a source line into (listing address, labels, mnemonic, operands, expected encoding).
+    """
+    line = line.split("//")[0].split(";")[0].strip()
+    address = None
+    labels = []
+    match = ADDRESS.match(line)
+    if match:
+        address = int(match.group(1), 16)
+        line = line[match.end():].strip()
+    while True:
+        match = LABEL.match(line)
+        if not match:
+            break
+        labels.append(match.group(1))
+        line = line[match.end():].strip()
+    if not line:
+        return address, labels, None, [], None
+    parts = line.split(None, 1)
+    mnemonic = parts[0].lower()
+    operands = [operand.strip() for operand in parts[1].split(",")] if len(parts) > 1 else []
+    expected = None
+    # The listing puts the encoding after the last operand, separated by whitespace
+    if operands:
+        last = operands[-1].split()
+        if len(last) == 2 and re.fullmatch(r"0[xX][0-9a-fA-F]{8}", last[1]):
+            operands[-1] = last[0]
+            expected = int(last[1], 16)
+    return address, labels, mnemonic, operands, expected
+
+
+def _size(mnemonic, operands):
+    """
+    Size in bytes of a statement, known in the first pass.
+    """
+    if mnemonic == "li":
+        upper, low = _split_li(_number(operands[1]))
+        return 4 if upper is None or low == 0 else 8
+    return 4
+
+
+def _expand(mnemonic, operands):
+    """
+    Rewrites a pseudo instruction into (mnemonic, operands) of real instructions.
+    """
+    if mnemonic == "nop":
+        return [("addi", ["x0", "x0", "0"])]
+    if mnemonic == "mv":
+        return [("addi", [operands[0], operands[1], "0"])]
+    if mnemonic == "not":
+        return [("xori", [operands[0], operands[1], "-1"])]
+    if mnemonic == "neg":
+        return [("sub", [operands[0], "x0", operands[1]])]
+    if mnemonic == "j":
+        return [("jal", ["x0", operands[0]])]
+    if mnemonic == "jr":
+        return [("jalr", ["x0", "0(%s)" % operands[0]])]
+    if mnemonic == "ret":
+        return [("jalr", ["x0", "0(ra)"])]
+    if mnemonic == "li":
+        upper, low = _split_li(_number(operands[1]))
+        if upper is None:
+            return [("addi", [operands[0], "x0", str(low)])]
+        if low == 0:
+            return [("lui", [operands[0], str(upper)])]
+        return [("lui", [operands[0], str(upper)]), ("addi", [operands[0], operands[0], str(low)])]
+    return [(mnemonic, operands)]
+
+
+def _encode(mnemonic, operands, address, labels):
+    """
+    Encodes one real instruction.
+
+    :param address: Byte address of the instruction, for PC relative targets.
+    :param labels: Label name -> address.
+    """
+    fmt = INSTRUCTION_SET[mnemonic][0]
+
+    def target(text):
+        text = text.strip()
+        if text in labels:
+            return labels[text] - address
+        try:
+            return _number(text)
+        except ValueError:
+            raise ValueError("Unknown label " + text) from None
+
+    def expect(count):
+        if len(operands) != count:
+            raise ValueError("%s takes %d operands, got %d" % (mnemonic, count, len(operands)))
+
+    if fmt == "R":
+        expect(3)
+        return encode_instruction(mnemonic, rd=_register(operands[0]), rs1=_register(operands[1]),
+                                  rs2=_register(operands[2]))
+    if fmt == "U":
+        expect(2)
+        return encode_instruction(mnemonic, rd=_register(operands[0]), imm=_number(operands[1]))
+    if fmt == "J":
+        # "jal label" links to ra
+        if len(operands) == 1:
+            return encode_instruction(mnemonic, rd=1, imm=target(operands[0]))
+        expect(2)
+        return encode_instruction(mnemonic, rd=_register(operands[0]), imm=target(operands[1]))
+    if fmt == "B":
+        expect(3)
+        return encode_instruction(mnemonic, rs1=_register(operands[0]), rs2=_register(operands[1]),
+                                  imm=target(operands[2]))
+    if fmt == "S":
+        expect(2)
+        match = MEMORY_OPERAND.match(operands[1])
+        if not match:
+            raise ValueError("%s expects an offset(register) operand" % mnemonic)
+        return encode_instruction(mnemonic, rs2=_register(operands[0]), rs1=_register(match.group(2)),
+                                  imm=_number(match.group(1) or "0"))
+    if fmt == "I" and len(operands) == 2:
+        # Loads and jalr: rd, offset(rs1)
+        match = MEMORY_OPERAND.match(operands[1])
+        if not match:
+            raise ValueError("%s expects an offset(register) operand" % mnemonic)
+        return encode_instruction(mnemonic, rd=_register(operands[0]), rs1=_register(match.group(2)),
+                                  imm=_number(match.group(1) or "0"))
+    expect(3)
+    return encode_instruction(mnemonic, rd=_register(operands[0]), rs1=_register(operands[1]),
+                              imm=_number(operands[2]))
+
+
+def assemble(source, filename="<source>"):
+    """
+    Assembles a program.
+
+    :param source: The source text.
+    :param filename: Name used in error messages.
+    :return: (image, listing), the bytearray image starting at address 0 and a list
+             of (address, word, source text) for every word of the image that was written.
+    """
+    statements = []
+    labels = {}
+    address = 0
+    # First pass: addresses of the statements and labels
+    for line_number, line in enumerate(source.splitlines(), 1):
+        try:
+            listed, names, mnemonic, operands, expected = _parse_line(line)
+            if listed is not None:
+                if listed < address:
+                    raise ValueError("Listing address 0x%08x is below the current address 0x%08x" % (listed, address))
+                address = listed
+            for name in names:
+                if name in labels:
+                    raise ValueError("Label %s defined twice" % name)
+                labels[name] = address
+            if mnemonic is None:
+                continue
+            if mnemonic == ".org":
+                origin = _number(operands[0])
+                if origin < address:
+                    raise ValueError(".org 0x%x is below the current address 0x%08x" % (origin, address))
+                address = origin
+                continue
+            if mnemonic != ".word" and mnemonic not in INSTRUCTION_SET and mnemonic not in PSEUDO_INSTRUCTIONS:
+                raise ValueError("Unknown instruction " + mnemonic)
+            if address & 3:
+                raise ValueError("Address 0x%08x is not word aligned" % address)
+            statements.append(_Statement(line_number, address, mnemonic, operands, expected))
+            address += _size(mnemonic, operands)
+        except (ValueError, IndexError) as error:
+            raise AssemblerError(str(error) or "missing operand", filename, line_number) from None
+
+    # Second pass: encoding
+    image = bytearray(address)
+    listing = []
+    for statement in statements:
+        try:
+            address = statement.address
+            if statement.mnemonic == ".word":
+                words = [_number(operand) & 0xFFFFFFFF for operand in statement.operands]
+            else:
+                words = []
+                for mnemonic, operands in _expand(statement.mnemonic, statement.operands):
+                    words.append(_encode(mnemonic, operands, address + 4 * len(words), labels))
+            if statement.expected is not None and words != [statement.expected]:
+                raise ValueError("Encoded 0x%08x, the listing says 0x%08x" % (words[0], statement.expected))
+            for word in words:
+                image[address : address + 4] = word.to_bytes(4, 'little')
+                listing.append((address, word, statement.text))
+                address += 4
+        except (ValueError, IndexError) as error:
+            raise AssemblerError(str(error) or "missing operand", filename, statement.line_number) from None
+    return image, listing
+
+
+def write_listing_hex(filename, listing):
+    """
+    Writes the assembled words as a $readmemh image (little endian bytes, one word
+    per line, the source line as comment). Gaps get an @address directive.
+    """
+    with open(filename, 'w') as file:
+        next_address = 0
+        for address, word, text in listing:
+            if address != next_address:
+                file.write("@%x\n" % address)
+            file.write("%s  // %08x: %s\n" % (" ".join("%02x" % b for b in word.to_bytes(4, 'little')),
+                                             address, text))
+            next_address = address + 4
+
+
+def _write_binary(filename, image):
+    with open(filename, 'wb') as file:
+        file.write(image)
+
+
+def source_key(source):
+    return hashlib.sha256(("RISCV_Assembler %d\n" % ASSEMBLER_VERSION + source).encode()).hexdigest()
+
+
+class AssemblyCache:
+    """
+    Assembled programs by source hash: <key>.hex for the HDL and <key>.bin (the
+    little endian image DecodedProgram takes) for the model. Entries are written to a temporary
+    file and renamed, so parallel runs can share one cache directory.
+    """
+    def __init__(self, directory=None):
+        """
+        :param directory: Cache directory, defaults to $RISCV_ASM_CACHE or asm_cache next to this file.
+        """
+        self.directory = directory or os.environ.get("RISCV_ASM_CACHE") or os.path.join(TEST_DIR, "asm_cache")
+        self.hits = 0
+        self.misses = 0
+
+    def paths(self, key):
+        return os.path.join(self.directory, key + ".hex"), os.path.join(self.directory, key + ".bin")
+
+    def _write(self, path, write):
+        """
+        Creates `path` through a temporary file in the cache directory, `write` gets its name.
+        """
+        file, temporary = tempfile.mkstemp(dir=self.directory)
+        os.close(file)
+        try:
+            write(temporary)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def assemble(self, source, filename="<source>"):
+        """
+        Assembles `source` unless it is cached already.
+
+        :return: (hex image path, binary image path)
+        """
+        hex_path, binary_path = self.paths(source_key(source))
+        if os.path.exists(hex_path) and os.path.exists(binary_path):
+            self.hits += 1
+            return hex_path, binary_path
+        self.misses += 1
+        image, listing = assemble(source, filename)
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(binary_path, lambda name: _write_binary(name, image))
+        # The image goes last, it marks the entry as complete
+        self._write(hex_path, lambda name: write_listing_hex(name, listing))
+        return hex_path, binary_path
+
+    def assemble_file(self, filename):
+        with open(filename, 'r') as file:
+            return self.assemble(file.read(), filename)
+
+    def image(self, filename):
+        """
+        :return: The hex image to simulate for `filename`, assembled if it is a source file.
+        """
+        if filename.lower().endswith(SOURCE_SUFFIXES):
+            return self.assemble_file(filename)[0]
+        return filename
+
+    def load(self, filename):
+        """
+        :return: A DecodedProgram of `filename`, a source file or a hex image.
+        """
+        if filename.lower().endswith(SOURCE_SUFFIXES):
+            with open(self.assemble_file(filename)[1], 'rb') as file:
+                return DecodedProgram(file.read())
+        return DecodedProgram.from_hex_lines(read_file_to_list(filename))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assemble an RV32I program into an Instruction_memory image")
+    parser.add_argument("source", help="assembly source or instruction listing")
+    parser.add_argument("-o", "--output", help="hex image to write (default: source name with .hex)")
+    parser.add_argument("--binary", help="also write the binary image to this file")
+    parser.add_argument("--cache", help="cache directory (default: $RISCV_ASM_CACHE or asm_cache)")
+    parser.add_argument("--print-path", action="store_true", help="only print the path of the cached hex image")
+    args = parser.parse_args()
+
+    cache = AssemblyCache(args.cache)
+    try:
+        hex_path, binary_path = cache.assemble_file(args.source)
+    except AssemblerError as error:
+        sys.exit(str(error))
+    if args.print_path:
+        print(hex_path)
+        return
+    output = args.output or os.path.splitext(args.source)[0] + ".hex"
+    shutil.copyfile(hex_path, output)
+    if args.binary:
+        shutil.copyfile(binary_path, args.binary)
+    print("%s -> %s%s" % (args.source, output, " (cached)" if cache.hits else ""))
+
+
+if __name__ == "__main__":
+    main()
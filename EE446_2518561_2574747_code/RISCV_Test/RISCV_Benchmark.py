@@ -0,0 +1,238 @@
+# RISCV_Benchmark.py
+#
+# Benchmark suite of the testbench. Every workload is an endless loop, so each run
+# simulates exactly --cycles clock cycles. For every workload the ISS throughput is
+# measured, then RISCV_Benchmark_Test runs it on the HDL and reports the wall time
+# per testbench phase, cycles/s and VPI reads per cycle. The merged JSON is meant
+# to be kept and compared across commits:
+#
+#   python RISCV_Benchmark.py --cycles 20000 --json benchmark.json
+#   python RISCV_Benchmark.py --cycles 20000 --baseline benchmark.json --tolerance 0.2
+#
+# --model-only skips the HDL runs, --profile writes a cProfile file per workload.
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from Helper_lib import DecodedProgram, encode_instruction, write_hex_image
+from Helper_Config import TestConfig
+from RISCV_ISS import RISCV_ISS
+from RISCV_Regression import SIM_ARTIFACTS, TEST_DIR, build, make_command
+
+E = encode_instruction
+
+
+def alu_workload():
+    """
+    Straight-line register/immediate ALU operations, one backward jump per 200 instructions.
+    """
+    rng = random.Random(0)
+    register_ops = ["add", "sub", "sll", "slt", "sltu", "xor", "srl", "sra", "or", "and"]
+    immediate_ops = ["addi", "slti", "sltiu", "xori", "ori", "andi"]
+    words = []
+    for _ in range(200):
+        rd, rs1, rs2 = rng.randrange(1, 16), rng.randrange(16), rng.randrange(16)
+        if rng.random() < 0.5:
+            words.append(E(rng.choice(register_ops), rd=rd, rs1=rs1, rs2=rs2))
+        else:
+            words.append(E(rng.choice(immediate_ops), rd=rd, rs1=rs1, imm=rng.randrange(-2048, 2048)))
+    words.append(E("jal", rd=0, imm=-4 * len(words)))
+    return words
+
+
+def branch_workload():
+    """
+    Countdown loop with a data dependent branch taken every other iteration.
+    """
+    return [
+        E("addi", rd=1, rs1=0, imm=100),   # 00: x1 = 100
+        E("addi", rd=1, rs1=1, imm=-1),    # 04: x1 -= 1
+        E("andi", rd=2, rs1=1, imm=1),     # 08: x2 = x1 & 1
+        E("beq", rs1=2, rs2=0, imm=8),     # 0c: skip the increment on even x1
+        E("addi", rd=3, rs1=3, imm=1),     # 10: x3 += 1
+        E("bne", rs1=1, rs2=0, imm=-16),   # 14: loop while x1 != 0
+        E("jal", rd=0, imm=-24),           # 18: restart
+    ]
+
+
+def load_store_workload():
+    """
+    Walks over 256 bytes of data memory with word, half and byte accesses.
+    """
+    return [
+        E("addi", rd=1, rs1=0, imm=0),     # 00: x1 = pointer
+        E("addi", rd=4, rs1=0, imm=256),   # 04: x4 = end
+        E("sw", rs1=1, rs2=2, imm=0),      # 08: mem[x1] = x2
+        E("lw", rd=3, rs1=1, imm=0),       # 0c
+        E("addi", rd=2, rs1=3, imm=3),     # 10
+        E("sb", rs1=1, rs2=2, imm=1),      # 14
+        E("lh", rd=5, rs1=1, imm=0),       # 18
+        E("lbu", rd=6, rs1=1, imm=1),      # 1c
+        E("sh", rs1=1, rs2=6, imm=2),      # 20
+        E("lhu", rd=7, rs1=1, imm=2),      # 24
+        E("lb", rd=8, rs1=1, imm=3),       # 28
+        E("addi", rd=1, rs1=1, imm=4),     # 2c
+        E("bne", rs1=1, rs2=4, imm=-40),   # 30: loop to 08
+        E("jal", rd=0, imm=-52),           # 34: restart
+    ]
+
+
+def uart_poll_workload():
+    """
+    Polls the empty UART receive FIFO, as firmware waiting for input does.
+    """
+    return [
+        E("addi", rd=6, rs1=0, imm=-1),    # 00: x6 = empty value
+        E("lw", rd=5, rs1=0, imm=0x404),   # 04: poll
+        E("beq", rs1=5, rs2=6, imm=-4),    # 08: until a byte arrives
+        E("sb", rs1=0, rs2=5, imm=0x400),  # 0c: echo it
+        E("jal", rd=0, imm=-12),           # 10
+    ]
+
+
+WORKLOADS = {
+    "alu": alu_workload,
+    "branch": branch_workload,
+    "load_store": load_store_workload,
+    "uart_poll": uart_poll_workload,
+}
+
+#Every run simulates the full budget without early termination
+BENCH_ENVIRONMENT = {"RISCV_HALT_ON_SPIN": "0", "RISCV_HALT_WORDS": "", "RISCV_TRACE_LEVEL": "mismatch"}
+
+
+def benchmark_model(words, cycles, repeat=3):
+    """
+    Measures the ISS alone on a workload, the fastest of `repeat` runs is reported.
+    """
+    image = bytearray(b"".join(word.to_bytes(4, 'little') for word in words))
+    setup_time = run_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        iss = RISCV_ISS(DecodedProgram(image))
+        iss.configure(TestConfig(halt_on_spin=False, halt_words=[]))
+        setup_time = min(setup_time, time.perf_counter() - start)
+        start = time.perf_counter()
+        executed = iss.run(cycles)
+        run_time = min(run_time, time.perf_counter() - start)
+    return {"setup_time": setup_time, "run_time": run_time, "instructions": executed,
+            "instructions_per_second": executed / run_time if run_time else 0}
+
+
+def benchmark_hdl(name, image, cycles, sim, sim_build, check_mode, out, profile):
+    """
+    Runs RISCV_Benchmark_Test on a workload image.
+
+    :return: The report written by the test, or a dict with "error".
+    """
+    report_file = os.path.join(out, name + ".json")
+    env = dict(os.environ, RISCV_MAX_CYCLES=str(cycles), RISCV_CHECK_MODE=check_mode,
+               RISCV_BENCH_REPORT=report_file, **BENCH_ENVIRONMENT)
+    if profile:
+        env["RISCV_BENCH_PROFILE"] = os.path.join(out, name + ".prof")
+    elif "RISCV_BENCH_PROFILE" in env:
+        del env["RISCV_BENCH_PROFILE"]
+    if os.path.exists(report_file):
+        os.remove(report_file)
+    start = time.perf_counter()
+    with open(os.path.join(out, name + ".log"), "w") as log:
+        subprocess.run(make_command(sim, sim_build, "MODULE=RISCV_Benchmark_Test", "PROGRAM=" + image,
+                                    "COCOTB_RESULTS_FILE=" + os.path.join(out, name + ".xml")),
+                       cwd=out, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if not os.path.exists(report_file):
+        return {"error": "no report written, see " + log.name}
+    with open(report_file) as file:
+        report = json.load(file)
+    # Includes simulator start-up and elaboration
+    report["process_time"] = time.perf_counter() - start
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TEST_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the throughput change of every measurement against a baseline result file.
+
+    :return: The number of measurements slower than the tolerance allows.
+    """
+    regressions = 0
+    for name, workload in results["workloads"].items():
+        for part, key in (("model", "instructions_per_second"), ("hdl", "cycles_per_second")):
+            old = baseline.get("workloads", {}).get(name, {}).get(part, {}).get(key)
+            new = workload.get(part, {}).get(key)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            slower = change < -tolerance
+            regressions += slower
+            print("%-12s %-6s %12.0f -> %12.0f  %+6.1f%%%s" % (name, part, old, new, 100 * change,
+                                                             "  SLOWER" if slower else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the model and the cocotb testbench")
+    parser.add_argument("--cycles", type=int, default=20000, help="clock cycles per workload")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--sim", default=os.environ.get("SIM", "icarus"), choices=sorted(SIM_ARTIFACTS))
+    parser.add_argument("--check-mode", default="lockstep", choices=["lockstep", "batch"])
+    parser.add_argument("--model-only", action="store_true", help="only benchmark the ISS, no HDL simulation")
+    parser.add_argument("--profile", action="store_true", help="write a cProfile file of every HDL run")
+    parser.add_argument("--out", default="benchmark_runs", help="directory for images, logs and profiles")
+    parser.add_argument("--json", default="benchmark.json", help="merged result file")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against --baseline")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out)
+    os.makedirs(out, exist_ok=True)
+    results = {"revision": git_revision(), "cycles": args.cycles, "sim": args.sim,
+               "check_mode": args.check_mode, "workloads": {}}
+    sim_build = os.path.join(out, "sim_build")
+    if not args.model_only:
+        start = time.perf_counter()
+        build(args.sim, sim_build)
+        results["build_time"] = time.perf_counter() - start
+
+    for name in args.workloads:
+        words = WORKLOADS[name]()
+        image = os.path.join(out, name + ".hex")
+        write_hex_image(image, words)
+        workload = results["workloads"][name] = {"model": benchmark_model(words, args.cycles)}
+        line = "%-12s model %10.0f instr/s" % (name, workload["model"]["instructions_per_second"])
+        if not args.model_only:
+            hdl = workload["hdl"] = benchmark_hdl(name, image, args.cycles, args.sim, sim_build,
+                                                  args.check_mode, out, args.profile)
+            if "error" in hdl:
+                line += "   hdl: " + hdl["error"]
+            else:
+                line += "   hdl %8.0f cycles/s %5.1f VPI reads/cycle   %s" % (
+                    hdl["cycles_per_second"], hdl["vpi_reads_per_cycle"],
+                    " ".join("%s %.2fs" % item for item in hdl["phases"].items()))
+        print(line)
+
+    # Read before writing, the baseline may be the file that is about to be replaced
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    with open(args.json, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    print("Results written to " + args.json)
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
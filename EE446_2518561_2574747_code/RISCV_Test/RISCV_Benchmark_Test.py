@@ -0,0 +1,118 @@
+# RISCV_Benchmark_Test.py
+#
+# Runs the normal testbench with timing and VPI read counters attached and writes
+# the measurements to $RISCV_BENCH_REPORT (JSON). RISCV_Benchmark.py runs it on the
+# benchmark workloads, it can also be run directly:
+#
+#   make MODULE=RISCV_Benchmark_Test RISCV_BENCH_REPORT=bench.json RISCV_BENCH_PROFILE=bench.prof
+#
+# The counters are attached from the outside (wrapped methods, counting handles),
+# the testbench itself does not pay for them when it is not benchmarked.
+
+import cProfile
+import json
+import os
+import time
+import cocotb
+from cocotb.triggers import FallingEdge, RisingEdge
+from Helper_lib import read_file_to_list
+from Helper_Config import TestConfig
+from RISCV_Computer_Test import TB, start_computer
+
+PHASES = ["setup", "model", "compare", "log", "simulator"]
+
+
+class VPICounter:
+    def __init__(self):
+        self.reads = 0
+
+
+class CountingHandle:
+    """
+    Forwards .value of a simulator handle and counts the reads.
+    """
+    __slots__ = ('handle', 'counter')
+
+    def __init__(self, handle, counter):
+        self.handle = handle
+        self.counter = counter
+
+    @property
+    def value(self):
+        self.counter.reads += 1
+        return self.handle.value
+
+
+class CountingRegisterFile:
+    def __init__(self, rf, counter):
+        self.Reg_Out = [CountingHandle(rf.Reg_Out[i], counter) for i in range(32)]
+
+
+def timed(phases, name, function):
+    """
+    Wraps `function` so that its wall time is added to phases[name].
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            phases[name] += time.perf_counter() - start
+    return wrapper
+
+
+@cocotb.test()
+async def RISCV_Benchmark_Test(dut):
+    config = TestConfig.load()
+    report_file = os.environ.get("RISCV_BENCH_REPORT", "benchmark.json")
+    profile_file = os.environ.get("RISCV_BENCH_PROFILE")
+    await start_computer(dut, config)
+    dut.reset.value=1
+    await RisingEdge(dut.clk)
+    dut.reset.value=0
+    await FallingEdge(dut.clk)
+
+    phases = dict.fromkeys(PHASES, 0.0)
+    counter = VPICounter()
+    start = time.perf_counter()
+    instruction_lines = read_file_to_list(cocotb.plusargs.get('program', 'Instructions.hex'))
+    tb = TB(instruction_lines, dut, CountingHandle(dut.PC, counter),
+            CountingRegisterFile(dut.datapath.rf, counter), config)
+    phases["setup"] = time.perf_counter() - start
+    # Instance attributes shadow the methods, run_test/run_test_batch call the wrappers
+    tb.performance_model = timed(phases, "model", tb.performance_model)
+    tb.iss.trace = timed(phases, "model", tb.iss.trace)
+    tb.compare_state = timed(phases, "compare", tb.compare_state)
+    tb.log_dut = timed(phases, "log", tb.log_dut)
+
+    profiler = cProfile.Profile() if profile_file else None
+    if profiler:
+        profiler.enable()
+    start = time.perf_counter()
+    if config.check_mode == "batch":
+        await tb.run_test_batch(config.max_cycles, config.sweep_interval)
+    else:
+        await tb.run_test()
+    run_time = time.perf_counter() - start
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(profile_file)
+
+    # Whatever is not spent in the testbench is spent in the simulator and the scheduler
+    phases["simulator"] = run_time - phases["model"] - phases["compare"] - phases["log"]
+    cycles = tb.clock_cycle_count
+    report = {
+        "check_mode": config.check_mode,
+        "trace_level": config.trace_level,
+        "cycles": cycles,
+        "run_time": run_time,
+        "cycles_per_second": cycles / run_time if run_time else 0,
+        "phases": phases,
+        "vpi_reads": counter.reads,
+        "vpi_reads_per_cycle": counter.reads / cycles if cycles else 0,
+    }
+    with open(report_file, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    dut._log.info("%d cycles, %.0f cycles/s, %.1f VPI reads/cycle, phases: %s", cycles,
+                  report["cycles_per_second"], report["vpi_reads_per_cycle"],
+                  ", ".join("%s %.2fs" % item for item in phases.items()))
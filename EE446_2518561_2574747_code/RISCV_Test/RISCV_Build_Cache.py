@@ -0,0 +1,215 @@
+# RISCV_Build_Cache.py
+#
+# Compile cache of the HDL, shared by all runs, run directories and worktrees of a
+# user. A build is keyed by the SHA-256 of the Verilog sources (their content, not
+# their path or timestamp), the toplevel, the simulator and its version, cocotb's
+# version and the compile flags. The Makefile calls it around cocotb's build rules:
+#
+#   restore  before make decides what to build: copies a cached build into SIM_BUILD,
+#            or removes a build of SIM_BUILD that was made from other sources or flags
+#   store    after make has built: copies the new build into the cache
+#
+# so the HDL is only elaborated again when it really changed. The cache lives in
+# $RISCV_BUILD_CACHE (default ~/.cache/riscv_sim_build), make BUILD_CACHE=0 disables it.
+#
+#   python RISCV_Build_Cache.py list
+#   python RISCV_Build_Cache.py prune --keep 20
+
+import argparse
+import hashlib
+import importlib.metadata
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+#Files of a compiled sim_build that are needed to run a simulation, the first one is built last
+SIM_ARTIFACTS = {
+    "icarus": ["sim.vvp", "cmds.f"],
+    # Vtop.mk is copied too, otherwise make regenerates the model
+    "verilator": ["Vtop", "Vtop.mk"],
+}
+
+SIMULATOR_VERSION_COMMANDS = {
+    "icarus": ["iverilog", "-V"],
+    "verilator": ["verilator", "--version"],
+}
+
+#Written into SIM_BUILD next to the artifacts, holds the key they were built for
+STAMP = "build_cache.key"
+
+
+def default_directory():
+    return os.environ.get("RISCV_BUILD_CACHE") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "riscv_sim_build")
+
+
+def simulator_version(sim):
+    try:
+        output = subprocess.run(SIMULATOR_VERSION_COMMANDS[sim], capture_output=True, text=True).stdout
+    except OSError:
+        return ""
+    return output.splitlines()[0] if output else ""
+
+
+def _file_hash(filename):
+    with open(filename, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def build_key(sim, toplevel, sources, flags):
+    """
+    :param sources: The Verilog source files.
+    :param flags: Everything else that goes into the build, as one string.
+    :return: The cache key, a hex digest.
+    """
+    digest = hashlib.sha256()
+    try:
+        cocotb_version = importlib.metadata.version("cocotb")
+    except importlib.metadata.PackageNotFoundError:
+        cocotb_version = ""
+    for item in (sim, simulator_version(sim), cocotb_version, toplevel, " ".join(flags.split())):
+        digest.update(item.encode() + b"\0")
+    # By name and content, the same HDL in another directory has the same key
+    for name, content in sorted((os.path.basename(source), _file_hash(source)) for source in sources):
+        digest.update(("%s %s\0" % (name, content)).encode())
+    return digest.hexdigest()
+
+
+def read_stamp(sim_build):
+    try:
+        with open(os.path.join(sim_build, STAMP)) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def _mark_current(sim_build, files, key):
+    """
+    Writes the stamp and gives it and `files` one timestamp, make then sees the
+    build as up to date: same time as the stamp, newer than the sources.
+    """
+    with open(os.path.join(sim_build, STAMP), 'w') as file:
+        file.write(key + "\n")
+    now = time.time()
+    for name in files + [STAMP]:
+        os.utime(os.path.join(sim_build, name), (now, now))
+
+
+class BuildCache:
+    def __init__(self, directory=None):
+        self.directory = directory or default_directory()
+
+    def entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def restore(self, key, sim, sim_build):
+        """
+        Makes SIM_BUILD hold the build of `key` if the cache has it.
+
+        :return: "current" (SIM_BUILD was up to date), "hit" (copied from the cache)
+                 or "miss" (make has to build, a stale build was removed).
+        """
+        artifacts = SIM_ARTIFACTS[sim]
+        present = all(os.path.exists(os.path.join(sim_build, name)) for name in artifacts)
+        if present and read_stamp(sim_build) == key:
+            # Sources that were only touched (checkout, rebase) do not trigger a build
+            _mark_current(sim_build, artifacts, key)
+            return "current"
+        # Built from other sources or flags, or before the cache was used
+        for name in artifacts + [STAMP]:
+            if os.path.exists(os.path.join(sim_build, name)):
+                os.remove(os.path.join(sim_build, name))
+        entry = self.entry(key)
+        if not os.path.isdir(entry):
+            return "miss"
+        os.makedirs(sim_build, exist_ok=True)
+        for name in artifacts:
+            shutil.copy2(os.path.join(entry, name), sim_build)
+        _mark_current(sim_build, artifacts, key)
+        # Entries are pruned by last use
+        os.utime(entry)
+        return "hit"
+
+    def store(self, key, sim, sim_build):
+        """
+        Copies a fresh build of SIM_BUILD into the cache.
+        """
+        artifacts = SIM_ARTIFACTS[sim]
+        entry = self.entry(key)
+        if not os.path.isdir(entry):
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = tempfile.mkdtemp(prefix=".tmp", dir=self.directory)
+            for name in artifacts:
+                shutil.copy2(os.path.join(sim_build, name), temporary)
+            try:
+                os.rename(temporary, entry)
+            except OSError:
+                # Another run stored the same build first
+                shutil.rmtree(temporary)
+        _mark_current(sim_build, artifacts, key)
+
+    def entries(self):
+        """
+        :return: (key, last use, size in bytes) of every entry, most recently used first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for key in os.listdir(self.directory):
+            entry = self.entry(key)
+            if key.startswith(".") or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+            entries.append((key, os.path.getmtime(entry), size))
+        return sorted(entries, key=lambda item: item[1], reverse=True)
+
+    def prune(self, keep):
+        """
+        Removes all but the `keep` most recently used entries.
+
+        :return: The number of removed entries.
+        """
+        removed = self.entries()[keep:]
+        for key, _, _ in removed:
+            shutil.rmtree(self.entry(key), ignore_errors=True)
+        return len(removed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile cache of the HDL shared across runs and worktrees")
+    parser.add_argument("command", choices=["restore", "store", "key", "list", "prune"])
+    parser.add_argument("sources", nargs="*", help="Verilog sources of the build")
+    parser.add_argument("--sim", default="icarus", choices=sorted(SIM_ARTIFACTS))
+    parser.add_argument("--toplevel", default="RISCV_Computer")
+    parser.add_argument("--flags", default="", help="compile flags, parameters etc. that select the build")
+    parser.add_argument("--sim-build", default="sim_build")
+    parser.add_argument("--cache", help="cache directory (default: $RISCV_BUILD_CACHE or ~/.cache/riscv_sim_build)")
+    parser.add_argument("--keep", type=int, default=20, help="entries kept by prune")
+    # The Makefile puts the sources after the options
+    args = parser.parse_intermixed_args()
+
+    cache = BuildCache(args.cache)
+    if args.command == "list":
+        for key, used, size in cache.entries():
+            print("%s  %s  %8.1f MiB" % (key[:16], time.strftime("%Y-%m-%d %H:%M", time.localtime(used)), size / 2**20))
+        return
+    if args.command == "prune":
+        print("Removed %d entries" % cache.prune(args.keep))
+        return
+    if not args.sources:
+        sys.exit("No Verilog sources given")
+    key = build_key(args.sim, args.toplevel, args.sources, args.flags)
+    if args.command == "key":
+        print(key)
+    elif args.command == "restore":
+        # The Makefile reads the status and the artifact its store rule depends on
+        print(cache.restore(key, args.sim, args.sim_build), SIM_ARTIFACTS[args.sim][0])
+    else:
+        cache.store(key, args.sim, args.sim_build)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,264 +1,252 @@
+import json
 import logging
 import cocotb
-from Helper_lib import read_file_to_list,Instruction, shift_helper, ByteAddressableMemory, reverse_hex_string_endiannes
-from Helper_Student import Log_Datapath,Log_Controller
+from Helper_lib import read_file_to_list, DecodedProgram
+from RISCV_ISS import RISCV_ISS
+from Helper_Config import TestConfig
+from Helper_Student import Log_Datapath,Log_Controller,ToHex
+from Helper_Trace import Tracer, sample_signals, TRACE_MISMATCH, TRACE_INSTRUCTION, TRACE_SIGNAL
+from Helper_UART import UARTDriver, UARTMonitor, start_clock
+from Helper_Backdoor import load_state
+from Helper_Counters import PerformanceCounters
 from cocotb.clock import Clock
 from cocotb.triggers import FallingEdge, RisingEdge, Edge, Timer
 from cocotb.binary import BinaryValue
+from cocotb.utils import get_sim_time
+
+#Period of the CPU clock clk
+CLOCK_PERIOD_NS = 10000
+
+
+#Compares an expected integer with a DUT value, values with 'x'/'z' bits never match
+def matches(expected, value):
+    try:
+        return expected == value
+    except ValueError:
+        return False
 
 
 class TB:
-    def __init__(self, Instruction_list, dut, dut_PC, dut_regfile):
+    def __init__(self, Instruction_list, dut, dut_PC, dut_regfile, config=None):
         self.dut = dut
         self.dut_PC = dut_PC
         self.dut_regfile = dut_regfile
         self.Instruction_list = Instruction_list
-        #Configure the logger
+        self.config = config if config is not None else TestConfig()
+        #Decode the whole program once, the model only indexes this table by PC
+        self.program = DecodedProgram.from_hex_lines(Instruction_list)
+        #Configure the logger, its level follows the trace tier
         self.logger = logging.getLogger("Performance Model")
-        self.logger.setLevel(logging.DEBUG)
+        self.tracer = Tracer(self.logger, self.config.trace_level, self.config.trace_depth)
+        #The instruction set simulator executes the program, TB only checks the DUT against it
         #Initial values are all 0 as in a FPGA
-        self.PC = 0
+        self.iss = RISCV_ISS(self.program, memory_size=self.config.memory_size)
+        self.iss.configure(self.config)
+        #Instruction mix, branch, memory and UART counters of the whole run, fast forward included
+        if self.config.counters:
+            self.iss.enable_counters(PerformanceCounters())
         self.Z_flag = 0
-        self.Register_File =[]
-        for i in range(32):
-            self.Register_File.append(0)
+        self.Register_File = self.iss.regs
         #Memory is a special class helper lib to simulate HDL counterpart    
-        self.memory = ByteAddressableMemory(1024)
+        self.memory = self.iss.memory
 
         self.clock_cycle_count = 0        
+        #Cycle the DUT started from, clock_cycle_count - hdl_start_cycle are the clk edges simulated
+        self.hdl_start_cycle = 0
           
-    #Calls user populated log functions    
+    #Calls user populated log functions and samples the traced signals (signal tier only)
     def log_dut(self):
+        if self.tracer.level < TRACE_SIGNAL:
+            return None
         Log_Datapath(self.dut,self.logger)
         Log_Controller(self.dut,self.logger)
+        return sample_signals(self.dut, self.tracer.signals)
+
+    #Keeps the context of the last cycles for the failure dump
+    def record(self, PC, signals):
+        if self.tracer.history is not None:
+            self.tracer.record(self.clock_cycle_count, PC, self.PC, tuple(self.Register_File), signals)
 
     #Compares and logs the PC and register file of Python module and HDL design
     def compare_result(self):
-        self.logger.debug("************* Performance Model / DUT Data  **************")
-        self.logger.debug("PC:0x%x \t PC:0x%x",self.PC,self.dut_PC.value.integer)
+        self.compare_state(self.PC, self.Register_File)
+
+    #Compares the given expected PC and register file against every DUT register
+    def compare_state(self, PC, Register_File):
+        dut_PC = self.dut_PC.value
+        dut_Register_File = [self.dut_regfile.Reg_Out[i].value for i in range(32)]
+        if self.tracer.level >= TRACE_INSTRUCTION:
+            self.log_state(logging.DEBUG, PC, Register_File, dut_PC, dut_Register_File)
+        if not (matches(PC, dut_PC) and all(matches(Register_File[i], dut_Register_File[i]) for i in range(32))):
+            self.report_mismatch(PC, dut_PC)
+            if self.tracer.level >= TRACE_MISMATCH:
+                self.tracer.dump(self.program)
+                self.log_state(logging.ERROR, PC, Register_File, dut_PC, dut_Register_File)
+        assert matches(PC, dut_PC), "PC mismatch at clock cycle %d" % self.clock_cycle_count
         for i in range(32):
-            self.logger.debug("Register%d: 0x%x \t 0x%x",i,self.Register_File[i], self.dut_regfile.Reg_Out[i].value.integer)
-        assert self.PC == self.dut_PC.value
+           assert matches(Register_File[i], dut_Register_File[i]), "Register%d mismatch at clock cycle %d" % (i, self.clock_cycle_count)
+
+    #Writes the failing cycle to config.mismatch_report, RISCV_Wave_Window places its dump window with it
+    def report_mismatch(self, PC, dut_PC):
+        if not self.config.mismatch_report:
+            return
+        report = {
+            "cycle": self.clock_cycle_count,
+            "hdl_cycle": self.clock_cycle_count - self.hdl_start_cycle,
+            "pc": PC,
+            "dut_pc": ToHex(dut_PC),
+            "sim_time_ns": get_sim_time('ns'),
+        }
+        with open(self.config.mismatch_report, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    def log_state(self, level, PC, Register_File, dut_PC, dut_Register_File):
+        self.logger.log(level, "************* Performance Model / DUT Data  **************")
+        self.logger.log(level, "PC:0x%x \t PC:%s",PC,ToHex(dut_PC))
         for i in range(32):
-           assert self.Register_File[i] == self.dut_regfile.Reg_Out[i].value
-        
+            self.logger.log(level, "Register%d: 0x%x \t %s",i,Register_File[i],ToHex(dut_Register_File[i]))
+
+    @property
+    def PC(self):
+        return self.iss.pc
+
     #Function to write into the register file (cannot write register 0 since it is hardwired to 0)
     def write_to_register_file(self,register_no, data):
-        if(data <0):
-            data = data +(1 << 32) 
-        if(register_no == 0):
-            pass
-        else:
-            self.Register_File[register_no] = data
+        if(register_no != 0):
+            self.Register_File[register_no] = data & 0xFFFFFFFF
 
-    #A model of the verilog code to confirm operation, data is In_data
+    #A model of the verilog code to confirm operation, executes one instruction on the ISS
+    #Returns False once the program has halted
     def performance_model (self):
-        self.logger.debug("**************** Clock cycle: %d **********************",self.clock_cycle_count)
-        self.clock_cycle_count = self.clock_cycle_count + 1
         #Read current instructions, extract and log the fields
-        self.logger.debug("**************** Instruction No: %d **********************",int((self.PC)/4))
-        current_instruction = self.Instruction_list[int((self.PC)/4)]
-        current_instruction = current_instruction.replace(" ", "")
-        #We need to reverse the order of bytes since little endian makes the string reversed in Python
-        current_instruction = reverse_hex_string_endiannes(current_instruction)
-
-        # parse into fields
-        instruction_fields = Instruction(current_instruction)
-        self.logger.debug("PC:0x%x \t PC:0x%x",self.PC,self.dut_PC.value.integer)
-        instruction_fields.log(self.logger)
-
-        # basic decoded fields
-        opcode   = instruction_fields.opcode
-        rd       = instruction_fields.rd
-        funct3   = instruction_fields.funct3
-        rs1      = instruction_fields.rs1
-        rs2      = instruction_fields.rs2
-        funct7   = instruction_fields.funct7
-        funct7_5 = instruction_fields.funct7_5
-        imm_I    = instruction_fields.imm_I
-        imm_S    = instruction_fields.imm_S
-        imm_B    = instruction_fields.imm_B
-        imm_U    = instruction_fields.imm_U
-        imm_J    = instruction_fields.imm_J
-
-        # register-file values
-        rs1_value = self.Register_File[rs1]
-        rs2_value = self.Register_File[rs2]
-
-        # default next PC
-        next_pc = (self.PC + 4) & 0xFFFFFFFF
-
-        signed_rs1_value = rs1_value - (1<<32) if (rs1_value & 0x80000000) else rs1_value
-        signed_rs2_value = rs2_value - (1<<32) if (rs2_value & 0x80000000) else rs2_value
-
-        unsigned_imm_I = imm_I + (1<<32) if (imm_I & 0x80000000) else imm_I
-        unsigned_imm_S = imm_S + (1<<32) if (imm_S & 0x80000000) else imm_S
-        unsigned_imm_B = imm_B + (1<<32) if (imm_B & 0x80000000) else imm_B
-        unsigned_imm_J = imm_J + (1<<32) if (imm_J & 0x80000000) else imm_J
-        unsigned_imm_U = imm_U + (1<<32) if (imm_U & 0x80000000) else imm_U
-
-
-
-
-        # R-TYPE (0x33)
-        if opcode == 0x33:
-            if   funct3 == 0x0 and funct7_5 == 0:      result = rs1_value + rs2_value           # ADD
-            elif funct3 == 0x0 and funct7_5 == 1:      result = rs1_value - rs2_value           # SUB
-            elif funct3 == 0x1:                        result = shift_helper(rs1_value, rs2_value & 31, 0)  # SLL
-            elif funct3 == 0x2:                        result = 1 if signed_rs1_value < signed_rs2_value else 0          # SLT
-            elif funct3 == 0x3:                        result = 1 if (rs1_value & 0xFFFFFFFF) < (rs2_value & 0xFFFFFFFF) else 0  # SLTU
-            elif funct3 == 0x4:                        result = rs1_value ^ rs2_value           # XOR
-            elif funct3 == 0x5 and funct7_5 == 0:      result = shift_helper(rs1_value, rs2_value & 31, 1)  # SRL
-            elif funct3 == 0x5 and funct7_5 == 1:      result = shift_helper(rs1_value, rs2_value & 31, 2)  # SRA
-            elif funct3 == 0x6:                        result = rs1_value | rs2_value           # OR
-            elif funct3 == 0x7:                        result = rs1_value & rs2_value           # AND
-            else:
-                self.logger.error(f"Unknown R-type funct3={funct3:x} f7_5={funct7_5}")
-                assert False
-            self.write_to_register_file(rd, result)
-
-
-        # I-TYPE ALU (0x13)
-        elif opcode == 0x13:
-            if   funct3 == 0x0: result = signed_rs1_value + imm_I         # ADDI
-            elif funct3 == 0x2: result = 1 if signed_rs1_value < imm_I else 0      # SLTI
-            elif funct3 == 0x3: result = 1 if (rs1_value & 0xFFFFFFFF) < (unsigned_imm_I & 0xFFFFFFFF) else 0  # SLTIU
-            elif funct3 == 0x4: result = rs1_value ^ unsigned_imm_I         # XORI
-            elif funct3 == 0x6: result = rs1_value | unsigned_imm_I         # ORI
-            elif funct3 == 0x7: result = rs1_value & unsigned_imm_I         # ANDI
-            elif funct3 == 0x1:                        # SLLI
-                result = shift_helper(rs1_value, imm_I & 0x1F, 0)
-            elif funct3 == 0x5 and funct7_5 == 0:      # SRLI
-                result = shift_helper(rs1_value, imm_I & 0x1F, 1)
-            elif funct3 == 0x5 and funct7_5 == 1:      # SRAI
-                result = shift_helper(rs1_value, imm_I & 0x1F, 2)
-            else:
-                self.logger.error(f"Unknown I-type funct3={funct3:x} f7_5={funct7_5}")
-                assert False
-            self.write_to_register_file(rd, result)
-
-
-        # LOAD (0x03)
-        elif opcode == 0x03:
-            addr = signed_rs1_value + imm_I
-            if addr == 0x00000404:
-                result = 0xFFFFFFFF
-            elif funct3 == 0x0:   # LB
-                byte = self.memory.memory[addr]
-                result  = (byte if byte < 0x80 else byte - 0x100)
-            elif funct3 == 0x1:   # LH
-                half = (self.memory.memory[addr+1]<<8) | self.memory.memory[addr]
-                result  = (half if half < 0x8000 else half - 0x10000)
-            elif funct3 == 0x2:   # LW
-                result = int.from_bytes(self.memory.read(addr))
-            elif funct3 == 0x4:   # LBU
-                result = self.memory.memory[addr]
-            elif funct3 == 0x5:   # LHU
-                result = (self.memory.memory[addr+1]<<8) | self.memory.memory[addr]
-            else:
-                self.logger.error(f"Unknown LOAD funct3={funct3:x}")
-                assert False
-            self.write_to_register_file(rd, result)
-
-
-         # STORE (0x23)
-        elif opcode == 0x23:
-            addr = signed_rs1_value + imm_S
-            if addr == 0x00000400:
-                pass
-            elif funct3 == 0x0:  # SB
-                # write single byte into the underlying bytearray
-                self.memory.memory[addr] = rs2_value & 0xFF
-            elif funct3 == 0x1:  # SH
-                half = rs2_value & 0xFFFF
-                self.memory.memory[addr]   = half & 0xFF
-                self.memory.memory[addr+1] = (half >> 8) & 0xFF
-            elif funct3 == 0x2:  # SW
-                # write a full 32-bit word (4 bytes little-endian)
-                self.memory.write(addr, rs2_value)
-            else:
-                self.logger.error(f"Unknown STORE funct3={funct3:x}")
-                assert False
-
-
-        # BRANCH (0x63)
-        elif opcode == 0x63:
-            take = False
-            if   funct3 == 0x0: take = (rs1_value == rs2_value)  # BEQ
-            elif funct3 == 0x1: take = (rs1_value != rs2_value)  # BNE
-            elif funct3 == 0x4: take = (signed_rs1_value < signed_rs2_value)   # BLT
-            elif funct3 == 0x5: take = (signed_rs1_value >= signed_rs2_value)  # BGE
-            elif funct3 == 0x6: take = ((rs1_value&0xFFFFFFFF) < (rs2_value&0xFFFFFFFF))   # BLTU
-            elif funct3 == 0x7: take = ((rs1_value&0xFFFFFFFF) >= (rs2_value&0xFFFFFFFF))  # BGEU
-            else:
-                self.logger.error(f"Unknown BRANCH funct3={funct3:x}")
-                assert False
-            if take:
-                next_pc = self.PC + imm_B
-
-
-        # JAL (0x6f)
-        elif opcode == 0x6f:
-            next_pc = self.PC + imm_J
-            self.write_to_register_file(rd, self.PC + 4)
-
-
-        # JALR (0x67)
-        elif opcode == 0x67:
-            next_pc = rs1_value + imm_I
-            self.write_to_register_file(rd, self.PC + 4)
-
-
-        # LUI  (0x37)
-        elif opcode == 0x37:
-            self.write_to_register_file(rd, imm_U)
-
-
-        # AUIPC (0x17)
-        elif opcode == 0x17:
-            self.write_to_register_file(rd, self.PC + imm_U)
-
-
-        else:
-            self.logger.error(f"Unknown opcode {opcode:02x} @ PC=0x{self.PC:08x}")
-            assert False
-
-        self.PC = next_pc
+        if self.tracer.level >= TRACE_INSTRUCTION and self.program.contains(self.PC):
+            self.logger.debug("**************** Clock cycle: %d **********************",self.clock_cycle_count)
+            self.logger.debug("**************** Instruction No: %d **********************",int((self.PC)/4))
+            instruction_fields = self.program.fetch(self.PC)
+            self.logger.debug("PC:0x%x \t PC:%s",self.PC,ToHex(self.dut_PC.value))
+            instruction_fields.log(self.logger)
+        if not self.iss.step():
+            return False
+        self.clock_cycle_count = self.clock_cycle_count + 1
+        return True
 
 
 
     async def run_test(self):
-        self.performance_model()
+        PC = self.PC
+        if not self.performance_model():
+            self.log_stop()
+            return
         #Wait 1 us the very first time bc. initially all signals are "X"
         await Timer(1, units="us")
-        self.log_dut()
+        self.record(PC, self.log_dut())
         await RisingEdge(self.dut.clk)
         await FallingEdge(self.dut.clk)
         self.compare_result()
-        #while(int(self.Instruction_list[int((self.PC)/4)].replace(" ", ""),16)!=0):
-        while True:
-            if (self.clock_cycle_count == 120):
+        while self.clock_cycle_count < self.config.max_cycles and not self.iss.halted:
+            PC = self.PC
+            if not self.performance_model():
                 break
-            self.performance_model()
             #Log datapath and controller before clock edge, this calls user filled functions
-            self.log_dut()
+            self.record(PC, self.log_dut())
             await RisingEdge(self.dut.clk)
             await FallingEdge(self.dut.clk)
             self.logger.debug("************* AFTER CLOCK EDGE  **************")
             self.compare_result()
+        self.log_stop()
+
+    #Loads the PC, registers and data memory of the model into the DUT (e.g. after iss.restore()),
+    #the instruction memory only if the program may have modified itself
+    def load_dut_state(self):
+        image = self.program.image if self.iss.self_modifying_code else None
+        load_state(self.dut, self.PC, self.Register_File, self.memory.dump(), image)
+
+    #Executes the first `cycles` cycles in the model only and continues the DUT from there,
+    #so HDL cycles are only spent on the part of the program under test. Call while clk is low.
+    def fast_forward(self, cycles):
+        self.clock_cycle_count = self.clock_cycle_count + self.iss.run(cycles)
+        self.hdl_start_cycle = self.clock_cycle_count
+        self.load_dut_state()
+        self.logger.info("Fast forwarded %d clock cycles to PC:0x%x", self.clock_cycle_count, self.PC)
+
+    #Reports why the run ended
+    def log_stop(self):
+        if self.iss.halted:
+            self.logger.info("Stopped after %d clock cycles: %s", self.clock_cycle_count, self.iss.halt_reason)
+        else:
+            self.logger.info("Stopped after %d clock cycles: cycle budget reached", self.clock_cycle_count)
+        self.write_counters()
+
+    #Writes the performance counters to config.counters and logs the hottest PCs
+    def write_counters(self):
+        counters = self.iss.counters
+        if counters is None:
+            return
+        for pc, count, name in counters.hot_pcs(5):
+            self.logger.info("Hot PC 0x%08x %-6s %d", pc, name, count)
+        self.logger.info("Counters written to %s", ", ".join(counters.write(self.config.counters)))
+
+    #Checks the DUT against a trace computed before the simulation starts.
+    #Every cycle only the PC and the written register are read from the DUT,
+    #the whole register file is compared every sweep_interval cycles and on a mismatch.
+    async def run_test_batch(self, cycles, sweep_interval=32):
+        previous_PC = self.PC
+        expected_registers = list(self.Register_File)
+        trace = self.iss.trace(cycles)
+        history = self.tracer.history
+        #Wait 1 us the very first time bc. initially all signals are "X"
+        await Timer(1, units="us")
+        for PC, rd, value in trace:
+            signals = self.log_dut()
+            await RisingEdge(self.dut.clk)
+            await FallingEdge(self.dut.clk)
+            self.clock_cycle_count = self.clock_cycle_count + 1
+            expected_registers[rd] = value
+            if history is not None:
+                self.tracer.record(self.clock_cycle_count, previous_PC, PC, tuple(expected_registers), signals)
+            if not matches(PC, self.dut_PC.value) or (rd and not matches(value, self.dut_regfile.Reg_Out[rd].value)):
+                self.logger.error("Mismatch at clock cycle %d, PC:0x%x rd:%d value:0x%x", self.clock_cycle_count, PC, rd, value)
+                self.compare_state(PC, expected_registers)
+                assert False
+            if sweep_interval and self.clock_cycle_count % sweep_interval == 0:
+                self.compare_state(PC, expected_registers)
+            previous_PC = PC
+        if trace:
+            self.compare_state(PC, expected_registers)
+        self.log_stop()
+
+
+#Starts clk and clk_100MHz (uart_clock_ratio times faster, shifted off the clk edges)
+#and returns a UART driver keeping rx idle and a monitor collecting the bytes sent on tx
+async def start_computer(dut, config):
+    await cocotb.start(Clock(dut.clk, CLOCK_PERIOD_NS, 'ns').start(start_high=False))
+    fast_period = CLOCK_PERIOD_NS / config.uart_clock_ratio
+    start_clock(dut.clk_100MHz, fast_period, fast_period / 4)
+    bit_time = config.uart_baud_clk_cycles * fast_period
+    return UARTDriver(dut.rx, bit_time), UARTMonitor(dut.tx, bit_time)
+
 
-                
-                   
 @cocotb.test()
 async def RISCV_Computer_Test(dut):
-    #Generate the clock
-    await cocotb.start(Clock(dut.clk, 10, 'us').start(start_high=False))
+    #Run length, termination, checking mode and UART timing come from $RISCV_CONFIG and RISCV_* variables
+    config = TestConfig.load()
+    #Generate the clocks
+    uart_rx, uart_tx = await start_computer(dut, config)
     #Reset onces before continuing with the tests
     dut.reset.value=1
     await RisingEdge(dut.clk)
     dut.reset.value=0
     await FallingEdge(dut.clk)
-    instruction_lines = read_file_to_list('Instructions.hex')
+    #The image is selected with +program=<file> (make PROGRAM=<file>), same as Instruction_memory
+    instruction_lines = read_file_to_list(cocotb.plusargs.get('program', 'Instructions.hex'))
     #Give PC signal handle and Register File MODULE handle
-    tb = TB(instruction_lines, dut, dut.PC, dut.datapath.rf)
-    await tb.run_test()
\ No newline at end of file
+    tb = TB(instruction_lines, dut, dut.PC, dut.datapath.rf, config)
+    if config.fast_forward:
+        tb.fast_forward(config.fast_forward)
+    #check_mode=batch compares against a precomputed trace instead of running the model every cycle
+    if config.check_mode == "batch":
+        await tb.run_test_batch(config.max_cycles - tb.clock_cycle_count, config.sweep_interval)
+    else:
+        await tb.run_test()
+    if uart_tx.received:
+        tb.logger.info("UART sent %d bytes: %r", len(uart_tx.received), bytes(uart_tx.received[:64]))
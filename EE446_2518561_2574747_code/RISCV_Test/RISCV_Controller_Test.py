@@ -0,0 +1,178 @@
+# RISCV_Controller_Test.py
+#
+# Exhaustive test of RISCV_Controller.v on its own. Every combination of opcode,
+# funct3, funct7_5, Zero and ALU_LessThan is applied with ALUResult at the UART
+# ports and one ordinary address, with only combinational settling per vector.
+# The outputs are compared with a reference decode table built from the model's
+# instruction set, and the mismatches are reported as an instruction x signal matrix:
+#
+#   make controller
+#
+# Encodings the model rejects (e.g. funct3=3 of a load) are not checked, the
+# controller may decode them as it likes. Unknown opcodes must keep all outputs
+# at their defaults, so that nothing is written.
+
+import cocotb
+from cocotb.triggers import Timer
+from Helper_lib import Instruction, INSTRUCTION_SET, mnemonic_of
+
+#ALUControl encodings of ALU.v, as used by the controller
+ALU_CONTROL = {"AND": 0b0000, "XOR": 0b0001, "SUB": 0b0010, "ADD": 0b0100, "SLT": 0b1000, "SLTU": 0b1001,
+               "SRA": 0b1010, "SRL": 0b1011, "OR": 0b1100, "MOVE": 0b1101, "SLL": 0b1110}
+
+#UART ports decoded by the controller: LW from UART_RX raises rd_en, SB to UART_TX raises send_req
+UART_TX = 0x400
+UART_RX = 0x404
+#ALUResult values applied to every encoding, the last one is an ordinary memory address
+ALU_RESULTS = [UART_TX, UART_RX, 0x000]
+
+#Outputs of RISCV_Controller and their values when nothing is decoded
+DEFAULTS = {"send_req": 0, "rd_en": 0, "SE2Control": 0, "StoreSel": 0, "PCSrc": 0, "ResultSrc": 0,
+            "MemWrite": 0, "ALUControl": ALU_CONTROL["ADD"], "ALUSrc": 0, "ImmSrc": 0, "RegWrite": 0,
+            "RegWSel": 0, "Jalr": 0}
+OUTPUTS = list(DEFAULTS)
+
+#ALU operation of the R-type and immediate instructions
+ALU_OPERATIONS = {"add": "ADD", "sub": "SUB", "sll": "SLL", "slt": "SLT", "sltu": "SLTU", "xor": "XOR",
+                  "srl": "SRL", "sra": "SRA", "or": "OR", "and": "AND",
+                  "addi": "ADD", "slli": "SLL", "slti": "SLT", "sltiu": "SLTU", "xori": "XOR",
+                  "srli": "SRL", "srai": "SRA", "ori": "OR", "andi": "AND"}
+
+#ImmSrc of the immediate formats
+IMM_I, IMM_S, IMM_B, IMM_J, IMM_U = 0, 1, 2, 3, 4
+
+#SE2Control of the loads and StoreSel of the stores
+LOAD_EXTEND = {"lw": 0, "lhu": 1, "lh": 2, "lbu": 3, "lb": 4}
+STORE_SIZE = {"sw": 0, "sh": 1, "sb": 2}
+
+#Branch ALU operation and whether it is taken, from (Zero, ALU_LessThan)
+BRANCHES = {
+    "beq":  ("SUB", lambda zero, less: zero),
+    "bne":  ("SUB", lambda zero, less: not zero),
+    "blt":  ("SLT", lambda zero, less: less),
+    "bge":  ("SLT", lambda zero, less: not less),
+    "bltu": ("SLTU", lambda zero, less: less),
+    "bgeu": ("SLTU", lambda zero, less: not less),
+}
+
+#Opcodes the model executes, the others must leave the outputs at DEFAULTS
+MODEL_OPCODES = frozenset(opcode for _, opcode, _, _ in INSTRUCTION_SET.values())
+
+
+def decode_name(opcode, funct3, funct7_5):
+    """
+    :return: The mnemonic the model decodes the fields to, None if it rejects them.
+    """
+    return mnemonic_of(Instruction(opcode | (funct3 << 12) | (funct7_5 << 30)))
+
+
+def reference(name, zero, less_than, alu_result):
+    """
+    Expected controller outputs of one decoded instruction.
+
+    :param name: Mnemonic from decode_name(), None for an opcode the model does not execute.
+    :return: {output: value}
+    """
+    expected = dict(DEFAULTS)
+    if name is None:
+        return expected
+    if name in ALU_OPERATIONS:
+        # The immediate forms take the second operand from ImmExt
+        immediate = INSTRUCTION_SET[name][1] == 0x13
+        expected.update(ALUSrc=int(immediate), RegWrite=1, ALUControl=ALU_CONTROL[ALU_OPERATIONS[name]])
+    elif name in LOAD_EXTEND:
+        expected.update(ALUSrc=1, RegWrite=1, ResultSrc=1, SE2Control=LOAD_EXTEND[name])
+        if name == "lw" and alu_result == UART_RX:
+            # The FIFO is popped and its output written back instead of ReadData
+            expected.update(rd_en=1, RegWSel=3)
+    elif name in STORE_SIZE:
+        expected.update(ALUSrc=1, ImmSrc=IMM_S, MemWrite=1, StoreSel=STORE_SIZE[name])
+        if name == "sb" and alu_result == UART_TX:
+            expected.update(send_req=1, MemWrite=0)
+    elif name in BRANCHES:
+        operation, taken = BRANCHES[name]
+        expected.update(ImmSrc=IMM_B, ALUControl=ALU_CONTROL[operation], PCSrc=int(bool(taken(zero, less_than))))
+    elif name == "jal":
+        expected.update(ImmSrc=IMM_J, RegWrite=1, RegWSel=1, PCSrc=1)
+    elif name == "jalr":
+        expected.update(ALUSrc=1, RegWrite=1, RegWSel=1, Jalr=1)
+    elif name == "lui":
+        # The immediate is passed through the ALU
+        expected.update(ALUSrc=1, ImmSrc=IMM_U, RegWrite=1, ALUControl=ALU_CONTROL["MOVE"])
+    elif name == "auipc":
+        expected.update(ALUSrc=1, ImmSrc=IMM_U, RegWrite=1, RegWSel=2)
+    else:
+        raise ValueError("No reference for " + name)
+    return expected
+
+
+def mismatch_matrix(mismatches, checked):
+    """
+    Formats the mismatch counts as a table, one row per instruction with a mismatch
+    and one column per output ("." = none).
+
+    :param mismatches: {row: {output: count}}
+    :param checked: {row: vectors checked}
+    :return: The lines of the table.
+    """
+    widths = [max(len(output), 3) for output in OUTPUTS]
+    lines = ["%-12s %7s  " % ("", "vectors") + " ".join(output.rjust(width) for output, width in zip(OUTPUTS, widths))]
+    for row in sorted(mismatches):
+        counts = mismatches[row]
+        lines.append("%-12s %7d  " % (row, checked[row]) + " ".join(
+            (str(counts[output]) if counts.get(output) else ".").rjust(width) for output, width in zip(OUTPUTS, widths)))
+    return lines
+
+
+@cocotb.test()
+async def Controller_Test(dut):
+    handles = [getattr(dut, output) for output in OUTPUTS]
+    settle = Timer(1, 'ns')
+    checked = {}
+    mismatches = {}
+    skipped = 0
+    errors = 0
+    for opcode in range(128):
+        dut.opcode.value = opcode
+        for funct3 in range(8):
+            dut.funct3.value = funct3
+            for funct7_5 in (0, 1):
+                dut.funct7_5.value = funct7_5
+                if opcode in MODEL_OPCODES:
+                    name = decode_name(opcode, funct3, funct7_5)
+                    if name is None:
+                        skipped += 2 * 2 * len(ALU_RESULTS)
+                        continue
+                    row = name
+                else:
+                    name = None
+                    row = "opcode 0x%02x" % opcode
+                for zero in (0, 1):
+                    dut.Zero.value = zero
+                    for less_than in (0, 1):
+                        dut.ALU_LessThan.value = less_than
+                        for alu_result in ALU_RESULTS:
+                            dut.ALUResult.value = alu_result
+                            await settle
+                            expected = reference(name, zero, less_than, alu_result)
+                            checked[row] = checked.get(row, 0) + 1
+                            for output, handle in zip(OUTPUTS, handles):
+                                value = handle.value
+                                actual = value.integer if value.is_resolvable else None
+                                if actual == expected[output]:
+                                    continue
+                                counts = mismatches.setdefault(row, {})
+                                counts[output] = counts.get(output, 0) + 1
+                                if errors < 10:
+                                    dut._log.error("%s (opcode=0x%02x funct3=%d funct7_5=%d Zero=%d ALU_LessThan=%d "
+                                                   "ALUResult=0x%x): %s expected %d got %s", row, opcode, funct3,
+                                                   funct7_5, zero, less_than, alu_result, output, expected[output],
+                                                   "x" if actual is None else actual)
+                                errors += 1
+    total = sum(checked.values())
+    dut._log.info("%d vectors checked, %d encodings rejected by the model skipped", total, skipped)
+    if mismatches:
+        for line in mismatch_matrix(mismatches, checked):
+            dut._log.info(line)
+    failed = sum(checked[row] for row in mismatches)
+    assert not mismatches, "%d output mismatches in %d instructions (%d vectors)" % (errors, len(mismatches), failed)
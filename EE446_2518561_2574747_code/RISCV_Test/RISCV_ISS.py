@@ -0,0 +1,491 @@
+# RISCV_ISS.py
+#
+# Standalone instruction set simulator for the RV32I subset implemented by the
+# single cycle processor (R/I/LOAD/STORE/BRANCH/JAL/JALR/LUI/AUIPC).
+# It does not depend on cocotb, so it can be used to produce expected traces
+# for large programs without starting a simulator:
+#
+#   python RISCV_ISS.py Instructions.hex -n 1000000 --trace expected.txt
+
+import argparse
+import copy
+import time
+from Helper_lib import read_file_to_list, ByteAddressableMemory, DecodedProgram, FUNCT7_5_DECODED
+from Helper_Config import TestConfig
+from Helper_Devices import DeviceBus, UART
+from Helper_Counters import PerformanceCounters
+from RISCV_Assembler import AssemblyCache
+
+MASK = 0xFFFFFFFF
+
+
+def _signed(value):
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+#ALU operations on unsigned 32 bit operands, keyed by (funct3, funct7_5)
+R_OPS = {
+    (0x0, 0): lambda a, b: (a + b) & MASK,                              # ADD
+    (0x0, 1): lambda a, b: (a - b) & MASK,                              # SUB
+    (0x1, 0): lambda a, b: (a << (b & 31)) & MASK,                      # SLL
+    (0x2, 0): lambda a, b: 1 if _signed(a) < _signed(b) else 0,         # SLT
+    (0x3, 0): lambda a, b: 1 if a < b else 0,                           # SLTU
+    (0x4, 0): lambda a, b: a ^ b,                                       # XOR
+    (0x5, 0): lambda a, b: a >> (b & 31),                               # SRL
+    (0x5, 1): lambda a, b: (_signed(a) >> (b & 31)) & MASK,             # SRA
+    (0x6, 0): lambda a, b: a | b,                                       # OR
+    (0x7, 0): lambda a, b: a & b,                                       # AND
+}
+
+#Immediate variants use the same operations, funct7_5 only selects SRAI
+I_OPS = {
+    (0x0, 0): R_OPS[(0x0, 0)],   # ADDI
+    (0x1, 0): R_OPS[(0x1, 0)],   # SLLI
+    (0x2, 0): R_OPS[(0x2, 0)],   # SLTI
+    (0x3, 0): R_OPS[(0x3, 0)],   # SLTIU
+    (0x4, 0): R_OPS[(0x4, 0)],   # XORI
+    (0x5, 0): R_OPS[(0x5, 0)],   # SRLI
+    (0x5, 1): R_OPS[(0x5, 1)],   # SRAI
+    (0x6, 0): R_OPS[(0x6, 0)],   # ORI
+    (0x7, 0): R_OPS[(0x7, 0)],   # ANDI
+}
+
+#Branch conditions on unsigned 32 bit operands, keyed by funct3
+BRANCH_OPS = {
+    0x0: lambda a, b: a == b,                    # BEQ
+    0x1: lambda a, b: a != b,                    # BNE
+    0x4: lambda a, b: _signed(a) < _signed(b),   # BLT
+    0x5: lambda a, b: _signed(a) >= _signed(b),  # BGE
+    0x6: lambda a, b: a < b,                     # BLTU
+    0x7: lambda a, b: a >= b,                    # BGEU
+}
+
+#Load size in bytes and memory accessor, keyed by funct3
+LOAD_OPS = {
+    0x0: (1, ByteAddressableMemory.load_byte_signed),   # LB
+    0x1: (2, ByteAddressableMemory.load_half_signed),   # LH
+    0x2: (4, ByteAddressableMemory.load_word),          # LW
+    0x4: (1, ByteAddressableMemory.load_byte),          # LBU
+    0x5: (2, ByteAddressableMemory.load_half),          # LHU
+}
+
+#Opcodes that write a destination register
+WRITEBACK_OPCODES = frozenset((0x33, 0x13, 0x03, 0x6f, 0x67, 0x37, 0x17))
+
+#Store size in bytes and memory accessor, keyed by funct3
+STORE_OPS = {
+    0x0: (1, ByteAddressableMemory.store_byte),   # SB
+    0x1: (2, ByteAddressableMemory.store_half),   # SH
+    0x2: (4, ByteAddressableMemory.store_word),   # SW
+}
+
+
+class Snapshot:
+    """
+    Architectural state of the ISS at an instruction boundary, see RISCV_ISS.snapshot().
+    """
+    def __init__(self, pc, regs, memory, instret, store_count, image, devices):
+        self.pc = pc
+        self.regs = regs
+        #bytes copies of the data memory and of the instruction image
+        self.memory = memory
+        self.image = image
+        self.instret = instret
+        self.store_count = store_count
+        #(DeviceBus, UART) pair, deep copied
+        self.devices = devices
+
+
+class Halted(Exception):
+    """
+    Raised by the halt handler, the instruction at the current PC is not executed.
+    """
+
+
+class RISCV_ISS:
+    """
+    Instruction set simulator of the single cycle processor.
+
+    Every instruction is decoded once into a (handler, instruction, operation) entry,
+    where the handler is looked up from the opcode table and the operation from the
+    funct3/funct7_5 tables. step() only indexes the entry by PC and calls the handler.
+    """
+    def __init__(self, program, memory_size=1024, memory=None):
+        """
+        :param program: A DecodedProgram holding the instruction image.
+        :param memory_size: Size of the data memory in bytes.
+        :param memory: Optional preloaded ByteAddressableMemory, replaces memory_size.
+        """
+        self.program = program
+        self.memory = memory if memory is not None else ByteAddressableMemory(memory_size)
+        self.regs = [0] * 32
+        self.pc = 0
+        #Executed instructions, also the clock cycle of the single cycle processor
+        self.instret = 0
+        #Memory mapped devices, loads and stores to their ports bypass the memory
+        self.bus = DeviceBus()
+        self.uart = self.bus.attach(UART())
+        #Set if stores may write into the instruction space
+        self.self_modifying_code = False
+        #Termination conditions, see Helper_Config for their meaning
+        self.halt_words = frozenset()
+        self.halt_on_spin = False
+        self.halt_address = None
+        self.halted = False
+        self.halt_reason = None
+        self.store_count = 0
+        self.spin_states = {}
+        self.handlers = {
+            0x33: (self._exec_op, R_OPS),
+            0x13: (self._exec_op_imm, I_OPS),
+            0x03: (self._exec_load, LOAD_OPS),
+            0x23: (self._exec_store, STORE_OPS),
+            0x63: (self._exec_branch, BRANCH_OPS),
+            0x6f: (self._exec_jal, None),
+            0x67: (self._exec_jalr, None),
+            0x37: (self._exec_lui, None),
+            0x17: (self._exec_auipc, None),
+        }
+        self.decoded = [None] * len(program)
+        #Helper_Counters.PerformanceCounters while profiling, see enable_counters()
+        self.counters = None
+
+    @classmethod
+    def from_hex_file(cls, filename, memory_size=1024, memory=None):
+        return cls(DecodedProgram.from_hex_lines(read_file_to_list(filename)), memory_size, memory)
+
+    def configure(self, config):
+        """
+        Applies the termination and UART options of a Helper_Config.TestConfig.
+        """
+        self.halt_words = frozenset(config.halt_words)
+        self.halt_on_spin = config.halt_on_spin
+        self.halt_address = config.halt_address
+        self.configure_uart(config.uart_mode, config.uart_baud_clk_cycles, config.uart_clock_ratio)
+        #Halt words that are already decoded need a new entry
+        self.decoded = [None] * len(self.program)
+
+    def configure_uart(self, mode, baud_clk_cycles, clock_ratio):
+        """
+        Replaces the UART with a new one of the given mode and timing.
+        """
+        self.bus.detach(self.uart)
+        self.uart = self.bus.attach(UART(self.uart.tx_address, mode, baud_clk_cycles, clock_ratio))
+
+    def snapshot(self):
+        """
+        Captures the PC, registers, data memory, instruction image and device state.
+        """
+        return Snapshot(self.pc, tuple(self.regs), bytes(self.memory.view), self.instret, self.store_count,
+                        bytes(self.program.image), copy.deepcopy((self.bus, self.uart)))
+
+    def restore(self, snapshot):
+        """
+        Returns to a state captured by snapshot(), the snapshot can be restored again later.
+        The register list is updated in place, so references to self.regs stay valid.
+        """
+        self.pc = snapshot.pc
+        self.regs[:] = snapshot.regs
+        self.memory.load_image(snapshot.memory)
+        self.instret = snapshot.instret
+        self.store_count = snapshot.store_count
+        if snapshot.image != self.program.image:
+            self.program.write(0, snapshot.image)
+        self.bus, self.uart = copy.deepcopy(snapshot.devices)
+        self.halted = False
+        self.halt_reason = None
+        self.spin_states = {}
+        self.decoded = [None] * len(self.program)
+
+    def enable_counters(self, counters):
+        """
+        Counts the executed instructions into `counters` (a PerformanceCounters),
+        None stops counting. Only the decoded entries change, so the step/run/trace
+        loops are the same with and without counters.
+        """
+        self.counters = counters
+        self.decoded = [None] * len(self.program)
+
+    def halt(self, reason):
+        self.halted = True
+        self.halt_reason = reason
+
+    def decode(self, pc):
+        """
+        Builds (and caches) the dispatch entry of the instruction at `pc`.
+        """
+        if not self.program.contains(pc):
+            return (self._exec_halt, None, "PC 0x%08x outside of the program image" % pc)
+        ins = self.program.fetch(pc)
+        if ins.word in self.halt_words:
+            entry = (self._exec_halt, ins, "halt instruction 0x%08x @ PC=0x%08x" % (ins.word, pc))
+            self.decoded[pc >> 2] = entry
+            return entry
+        try:
+            handler, ops = self.handlers[ins.opcode]
+        except KeyError:
+            raise ValueError(f"Unknown opcode {ins.opcode:02x} @ PC=0x{pc:08x}") from None
+        operation = None
+        if ops is R_OPS or ops is I_OPS:
+            # funct7_5 only selects SUB and the arithmetic right shifts
+            if (ins.opcode, ins.funct3) in FUNCT7_5_DECODED:
+                operation = ops.get((ins.funct3, ins.funct7_5))
+            else:
+                operation = ops.get((ins.funct3, 0))
+        elif ops is not None:
+            operation = ops.get(ins.funct3)
+        if ops is not None and operation is None:
+            raise ValueError(f"Unknown funct3={ins.funct3:x} f7_5={ins.funct7_5} for opcode {ins.opcode:02x} @ PC=0x{pc:08x}")
+        entry = (handler, ins, operation)
+        if self.counters is not None:
+            entry = self.counters.wrap(entry, pc, self)
+        self.decoded[pc >> 2] = entry
+        return entry
+
+    def step(self):
+        """
+        Executes a single instruction.
+
+        :return: False if the simulator is halted and nothing was executed.
+        """
+        if self.halted:
+            return False
+        pc = self.pc
+        try:
+            entry = self.decoded[pc >> 2]
+        except IndexError:
+            entry = None
+        if entry is None:
+            entry = self.decode(pc)
+        handler, ins, operation = entry
+        try:
+            self.pc = handler(ins, operation, pc)
+        except Halted:
+            return False
+        self.instret += 1
+        return True
+
+    def run(self, n):
+        """
+        Executes up to `n` instructions, stopping early when the program halts.
+
+        :return: The number of instructions executed.
+        """
+        decoded = self.decoded
+        decode = self.decode
+        pc = self.pc
+        start = self.instret
+        try:
+            for _ in range(n):
+                if self.halted:
+                    break
+                try:
+                    entry = decoded[pc >> 2]
+                except IndexError:
+                    entry = None
+                if entry is None:
+                    entry = decode(pc)
+                handler, ins, operation = entry
+                pc = self.pc = handler(ins, operation, pc)
+                self.instret += 1
+        except Halted:
+            pass
+        return self.instret - start
+
+    def trace(self, n):
+        """
+        Executes up to `n` instructions and returns the expected trace as a list of
+        (next PC, rd, written value) tuples, rd is 0 for instructions without write-back.
+        """
+        decoded = self.decoded
+        decode = self.decode
+        regs = self.regs
+        pc = self.pc
+        trace = []
+        append = trace.append
+        try:
+            for _ in range(n):
+                if self.halted:
+                    break
+                try:
+                    entry = decoded[pc >> 2]
+                except IndexError:
+                    entry = None
+                if entry is None:
+                    entry = decode(pc)
+                handler, ins, operation = entry
+                pc = self.pc = handler(ins, operation, pc)
+                self.instret += 1
+                rd = ins.rd if ins.opcode in WRITEBACK_OPCODES else 0
+                append((pc, rd, regs[rd]))
+        except Halted:
+            pass
+        return trace
+
+    def check_spin(self, target):
+        """
+        Called on backward jumps. Halts if the loop starting at `target` was entered
+        before with the same registers, no store in between and the same device state,
+        since a deterministic program would then spin forever. Nothing is decided while
+        a device still has events of its own pending (e.g. UART bytes in flight).
+        """
+        if not self.bus.quiescent():
+            self.spin_states.pop(target, None)
+            return
+        state = (tuple(self.regs), self.store_count, self.bus.state())
+        if self.spin_states.get(target) == state:
+            self.halt("spin loop @ PC=0x%08x" % target)
+        else:
+            self.spin_states[target] = state
+
+    # ---------------------------------------------------------------- handlers
+    # Each handler executes one instruction and returns the next PC.
+
+    def _exec_halt(self, ins, reason, pc):
+        self.halt(reason)
+        raise Halted(reason)
+
+    def _exec_op(self, ins, operation, pc):
+        regs = self.regs
+        if ins.rd:
+            regs[ins.rd] = operation(regs[ins.rs1], regs[ins.rs2])
+        return (pc + 4) & MASK
+
+    def _exec_op_imm(self, ins, operation, pc):
+        if ins.rd:
+            self.regs[ins.rd] = operation(self.regs[ins.rs1], ins.imm_I & MASK)
+        return (pc + 4) & MASK
+
+    def _exec_load(self, ins, operation, pc):
+        addr = (self.regs[ins.rs1] + ins.imm_I) & MASK
+        size, load = operation
+        device = self.bus.loads[size].get(addr)
+        if device is not None:
+            value = device.load(addr, self.instret) & MASK
+        else:
+            try:
+                value = load(self.memory, addr) & MASK
+            except ValueError as error:
+                raise ValueError(f"{error} @ PC=0x{pc:08x}") from None
+        if ins.rd:
+            self.regs[ins.rd] = value
+        return (pc + 4) & MASK
+
+    def _exec_store(self, ins, operation, pc):
+        addr = (self.regs[ins.rs1] + ins.imm_S) & MASK
+        size, store = operation
+        device = self.bus.stores[size].get(addr)
+        if device is not None:
+            device.store(addr, self.regs[ins.rs2], self.instret)
+        else:
+            try:
+                store(self.memory, addr, self.regs[ins.rs2])
+            except ValueError as error:
+                raise ValueError(f"{error} @ PC=0x{pc:08x}") from None
+            self.store_count += 1
+            if self.self_modifying_code and self.program.contains(addr):
+                self.program.write(addr, self.memory.dump(addr, size).tobytes())
+                for index in range(addr >> 2, ((addr + size - 1) >> 2) + 1):
+                    self.decoded[index] = None
+        if addr == self.halt_address:
+            self.halt("store to halt address 0x%08x @ PC=0x%08x" % (addr, pc))
+        return (pc + 4) & MASK
+
+    def _exec_branch(self, ins, condition, pc):
+        if condition(self.regs[ins.rs1], self.regs[ins.rs2]):
+            target = (pc + ins.imm_B) & MASK
+            if target <= pc and self.halt_on_spin:
+                self.check_spin(target)
+            return target
+        return (pc + 4) & MASK
+
+    def _exec_jal(self, ins, operation, pc):
+        if ins.rd:
+            self.regs[ins.rd] = (pc + 4) & MASK
+        target = (pc + ins.imm_J) & MASK
+        if target <= pc and self.halt_on_spin:
+            self.check_spin(target)
+        return target
+
+    def _exec_jalr(self, ins, operation, pc):
+        target = (self.regs[ins.rs1] + ins.imm_I) & 0xFFFFFFFE
+        if ins.rd:
+            self.regs[ins.rd] = (pc + 4) & MASK
+        if target <= pc and self.halt_on_spin:
+            self.check_spin(target)
+        return target
+
+    def _exec_lui(self, ins, operation, pc):
+        if ins.rd:
+            self.regs[ins.rd] = ins.imm_U
+        return (pc + 4) & MASK
+
+    def _exec_auipc(self, ins, operation, pc):
+        if ins.rd:
+            self.regs[ins.rd] = (pc + ins.imm_U) & MASK
+        return (pc + 4) & MASK
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a hex image on the RV32I instruction set simulator")
+    parser.add_argument("image", help="$readmemh style instruction image or assembly source (see RISCV_Assembler)")
+    parser.add_argument("-n", "--instructions", type=int, help="number of instructions to execute (default: max_cycles)")
+    parser.add_argument("--memory-size", type=int, help="data memory size in bytes (default: memory_size)")
+    parser.add_argument("--memory-image", help="binary data memory image, memory mapped copy-on-write")
+    parser.add_argument("--dump-memory", help="write the data memory to this binary file after the run")
+    parser.add_argument("--trace", help="write the PC and register file after every instruction to this file")
+    parser.add_argument("--no-halt", action="store_true", help="ignore the termination conditions of the configuration")
+    parser.add_argument("--uart-input", help="file whose bytes are received by the UART")
+    parser.add_argument("--counters", help="write the performance counters to this file (.json or .csv)")
+    parser.add_argument("--heatmap-granularity", type=int, default=4, help="bytes per load/store heatmap bucket")
+    parser.add_argument("--top", type=int, default=10, help="hot PCs printed with --counters")
+    args = parser.parse_args()
+
+    config = TestConfig.load()
+    memory_size = args.memory_size or config.memory_size
+    memory = None
+    if args.memory_image:
+        memory = ByteAddressableMemory(memory_size, backing_file=args.memory_image)
+    iss = RISCV_ISS(AssemblyCache().load(args.image), memory_size, memory)
+    iss.configure(config)
+    if args.no_halt:
+        iss.halt_words = frozenset()
+        iss.halt_on_spin = False
+        iss.halt_address = None
+    if args.uart_input:
+        with open(args.uart_input, 'rb') as file:
+            iss.uart.receive(file.read())
+    if args.counters:
+        iss.enable_counters(PerformanceCounters(args.heatmap_granularity))
+    n = args.instructions if args.instructions is not None else config.max_cycles
+    start = time.perf_counter()
+    if args.trace:
+        with open(args.trace, 'w') as trace:
+            for _ in range(n):
+                if not iss.step():
+                    break
+                trace.write("%08x %s\n" % (iss.pc, " ".join("%08x" % r for r in iss.regs)))
+    else:
+        iss.run(n)
+    elapsed = time.perf_counter() - start
+    print("Executed %d instructions in %.3f s (%.0f instructions/s)"
+          % (iss.instret, elapsed, iss.instret / elapsed if elapsed else 0))
+    if iss.halted:
+        print("Halted: " + iss.halt_reason)
+    if iss.uart.transmitted or iss.uart.received:
+        print("UART: received %d bytes (%d lost), transmitted %d bytes (%d dropped): %r"
+              % (iss.uart.received, iss.uart.rx_dropped, len(iss.uart.transmitted),
+                 iss.uart.tx_dropped, bytes(iss.uart.transmitted[:64])))
+    if args.dump_memory:
+        iss.memory.save_file(args.dump_memory)
+    if args.counters:
+        counters = iss.counters
+        for pc, count, name in counters.hot_pcs(args.top):
+            print("  0x%08x %-6s %10d  %5.1f%%" % (pc, name, count, 100 * count / iss.instret))
+        print("Data memory used: %d bytes, UART FIFO level up to %d"
+              % (counters.memory_high_water, counters.uart["max_fifo_level"]))
+        print("Counters written to " + ", ".join(counters.write(args.counters)))
+
+
+if __name__ == "__main__":
+    main()
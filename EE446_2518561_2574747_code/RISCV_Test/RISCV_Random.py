@@ -0,0 +1,407 @@
+# RISCV_Random.py
+#
+# Constrained-random RV32I program generator with coverage feedback.
+# Programs are built while they are executed on the instruction set simulator,
+# so every branch/jump target, load/store address and branch outcome is known
+# when the instruction is placed. Coverage is collected from the executed
+# instructions and carried over to the next program, which biases the choice of
+# instructions, registers and immediate signs towards bins that are not hit yet.
+#
+#   python RISCV_Random.py --out random_tests --programs 20 --until-full
+
+import argparse
+import json
+import os
+import random
+from Helper_lib import DecodedProgram, INSTRUCTION_SET, encode_instruction, mnemonic_of, write_hex_image
+from RISCV_ISS import RISCV_ISS, BRANCH_OPS, MASK
+
+NOP = encode_instruction("addi")
+
+BRANCHES = [name for name, entry in INSTRUCTION_SET.items() if entry[0] == "B"]
+SIGNS = ("neg", "zero", "pos")
+
+
+def sign_of(value):
+    return "neg" if value < 0 else "zero" if value == 0 else "pos"
+
+
+class Coverage:
+    """
+    Hit counts of the decode, branch outcome, register and immediate sign bins.
+    """
+    def __init__(self):
+        self.kinds = {name: 0 for name in INSTRUCTION_SET}
+        self.branches = {"%s_%s" % (name, outcome): 0 for name in BRANCHES for outcome in ("taken", "not_taken")}
+        self.registers = {"%s_x%d" % (field, r): 0 for field in ("rd", "rs1", "rs2") for r in range(32)}
+        self.immediates = {"%s_%s" % (fmt, sign): 0 for fmt in ("I", "S", "B", "U", "J") for sign in SIGNS}
+
+    def groups(self):
+        return {"kinds": self.kinds, "branches": self.branches,
+                "registers": self.registers, "immediates": self.immediates}
+
+    def sample(self, ins, taken):
+        """
+        Records one executed instruction.
+
+        :param ins: The executed Instruction.
+        :param taken: True if the instruction changed the PC to something other than PC+4.
+        """
+        name = mnemonic_of(ins)
+        if name is None:
+            return
+        self.kinds[name] += 1
+        fmt = INSTRUCTION_SET[name][0]
+        if fmt != "B" and fmt != "S":
+            self.registers["rd_x%d" % ins.rd] += 1
+        if fmt != "U" and fmt != "J":
+            self.registers["rs1_x%d" % ins.rs1] += 1
+        if fmt in ("R", "S", "B"):
+            self.registers["rs2_x%d" % ins.rs2] += 1
+        if fmt == "B":
+            self.branches["%s_%s" % (name, "taken" if taken else "not_taken")] += 1
+            self.immediates["B_" + sign_of(ins.imm_B)] += 1
+        elif fmt == "I":
+            self.immediates["I_" + sign_of(ins.imm_I)] += 1
+        elif fmt == "S":
+            self.immediates["S_" + sign_of(ins.imm_S)] += 1
+        elif fmt == "U":
+            self.immediates["U_" + sign_of(ins.imm_U - (1 << 32) if ins.imm_U & 0x80000000 else ins.imm_U)] += 1
+        elif fmt == "J":
+            self.immediates["J_" + sign_of(ins.imm_J)] += 1
+
+    def missing(self):
+        return [name for group in self.groups().values() for name, hits in group.items() if hits == 0]
+
+    def percent(self):
+        bins = sum(len(group) for group in self.groups().values())
+        return 100.0 * (bins - len(self.missing())) / bins
+
+    def to_dict(self):
+        return dict(self.groups(), percent=self.percent(), missing=self.missing())
+
+
+def sample_program(iss, coverage, max_steps=100000):
+    """
+    Runs a program on the ISS and records the coverage of every executed instruction.
+    """
+    for _ in range(max_steps):
+        pc = iss.pc
+        if not iss.program.contains(pc):
+            break
+        ins = iss.program.fetch(pc)
+        if not iss.step():
+            break
+        coverage.sample(ins, iss.pc != (pc + 4) & MASK)
+
+
+class RandomProgramGenerator:
+    def __init__(self, coverage=None, rng=None, program_size=1024, memory_size=1024):
+        """
+        :param coverage: Coverage shared between programs, new programs favour its empty bins.
+        :param rng: random.Random instance.
+        :param program_size: Size of Instruction_memory in bytes.
+        :param memory_size: Size of the data memory in bytes.
+        """
+        self.coverage = coverage if coverage is not None else Coverage()
+        self.rng = rng if rng is not None else random.Random()
+        self.program_size = program_size
+        self.memory_size = memory_size
+
+    # ------------------------------------------------------------- selection
+
+    def weighted(self, choices, hits):
+        """
+        Picks one of `choices`, an item hit h times has weight 1/(1+h)^2.
+        """
+        weights = [1.0 / (1 + hits(choice)) ** 2 for choice in choices]
+        return self.rng.choices(choices, weights)[0]
+
+    def pick_register(self, field):
+        return self.weighted(range(32), lambda r: self.coverage.registers["%s_x%d" % (field, r)])
+
+    def pick_sign(self, fmt):
+        return self.weighted(SIGNS, lambda sign: self.coverage.immediates["%s_%s" % (fmt, sign)])
+
+    def pick_immediate(self, sign, low=-2048, high=2047):
+        if sign == "neg":
+            return self.rng.choice((low, -1, self.rng.randint(low, -1)))
+        if sign == "pos":
+            return self.rng.choice((high, 1, self.rng.randint(1, high)))
+        return 0
+
+    # --------------------------------------------------------------- placing
+
+    def free(self, pc, count):
+        index = pc >> 2
+        return index + count <= len(self.used) and not any(self.used[index : index + count])
+
+    def free_run(self, start, count, end=None):
+        """
+        Returns the first address >= start with `count` free slots, None if there is none.
+        """
+        end = len(self.used) * 4 if end is None else min(end, len(self.used) * 4)
+        for pc in range(start, end, 4):
+            if self.free(pc, count):
+                return pc
+        return None
+
+    def place(self, mnemonic, rd=0, rs1=0, rs2=0, imm=0):
+        """
+        Places one instruction at the current PC and executes it.
+        """
+        pc = self.iss.pc
+        word = encode_instruction(mnemonic, rd, rs1, rs2, imm)
+        self.program.write(pc, word.to_bytes(4, 'little'))
+        self.iss.decoded[pc >> 2] = None
+        self.used[pc >> 2] = True
+        ins = self.program.fetch(pc)
+        self.iss.step()
+        self.coverage.sample(ins, self.iss.pc != pc + 4)
+        self.executed += 1
+
+    def ensure(self, count):
+        """
+        Makes sure that `count` instructions can be placed in a row from the current PC,
+        keeping one spare slot for the next jump. Jumps forward to free slots if needed.
+
+        :return: False if the program is full.
+        """
+        pc = self.iss.pc
+        if self.free(pc, count + 1):
+            return True
+        target = self.free_run(pc + 4, count + 1)
+        if target is None:
+            return False
+        self.place("jal", 0, imm=target - pc)
+        return True
+
+    def set_register(self, r, value):
+        if r != 0:
+            self.place("addi", r, 0, imm=value)
+
+    def branch_operands(self, mnemonic, rs1, rs2, taken):
+        """
+        Returns small register values (a, b) for which the branch outcome is `taken`,
+        None if no such values exist for this register pair.
+        """
+        condition = BRANCH_OPS[INSTRUCTION_SET[mnemonic][2]]
+        for _ in range(64):
+            a = 0 if rs1 == 0 else self.rng.choice((self.rng.randint(-2048, 2047), -1, 0, 1))
+            b = a if rs2 == rs1 else 0 if rs2 == 0 else self.rng.choice((a, self.rng.randint(-2048, 2047), -1, 0, 1))
+            if condition(a & MASK, b & MASK) == taken:
+                return a, b
+        return None
+
+    # -------------------------------------------------------------- emitters
+    # Each emitter returns False if the program is full.
+
+    def emit_register(self, mnemonic):
+        if not self.ensure(1):
+            return False
+        self.place(mnemonic, self.pick_register("rd"), self.pick_register("rs1"), self.pick_register("rs2"))
+        return True
+
+    def emit_immediate(self, mnemonic):
+        if not self.ensure(1):
+            return False
+        if INSTRUCTION_SET[mnemonic][0] == "IS":
+            imm = self.rng.randint(0, 31)
+        else:
+            imm = self.pick_immediate(self.pick_sign("I"))
+        self.place(mnemonic, self.pick_register("rd"), self.pick_register("rs1"), imm=imm)
+        return True
+
+    def emit_memory(self, mnemonic):
+        if not self.ensure(2):
+            return False
+        fmt = INSTRUCTION_SET[mnemonic][0]
+        size = 1 << (INSTRUCTION_SET[mnemonic][2] & 3)
+        sign = self.pick_sign(fmt)
+        rs1 = self.pick_register("rs1")
+        if rs1 == 0 and sign == "neg":
+            rs1 = self.rng.randint(1, 31)
+        addr = self.rng.randrange(0, self.memory_size - size + 1, size)
+        if rs1 == 0:
+            imm = addr
+        else:
+            # base = addr - imm has to fit the 12 bit immediate of the setup addi
+            if sign == "neg":
+                imm = self.rng.randint(max(-2048, addr - 2047), -1)
+            elif sign == "pos":
+                imm = self.rng.randint(1, min(2047, addr + 2048))
+            else:
+                imm = 0
+            self.set_register(rs1, addr - imm)
+        if fmt == "S":
+            self.place(mnemonic, 0, rs1, self.pick_register("rs2"), imm)
+        else:
+            self.place(mnemonic, self.pick_register("rd"), rs1, imm=imm)
+        return True
+
+    def emit_branch(self, mnemonic):
+        if not self.ensure(3):
+            return False
+        taken = self.weighted((True, False), lambda t: self.coverage.branches[
+            "%s_%s" % (mnemonic, "taken" if t else "not_taken")])
+        sign = self.pick_sign("B")
+        if sign == "zero":
+            # A taken branch to itself never terminates
+            taken = False
+        pc = self.iss.pc
+        if taken and sign == "neg":
+            # Trampoline: jump forward, set up the operands and branch back behind the jump
+            trampoline = self.free_run(pc + 8, 4)
+            if trampoline is None:
+                taken, sign = False, "pos"
+        for _ in range(16):
+            rs1, rs2 = self.pick_register("rs1"), self.pick_register("rs2")
+            operands = self.branch_operands(mnemonic, rs1, rs2, taken)
+            if operands is not None:
+                break
+        else:
+            return self.emit_register("add")
+        if taken and sign == "neg":
+            self.place("jal", 0, imm=trampoline - pc)
+            self.set_register(rs1, operands[0])
+            self.set_register(rs2, operands[1])
+            self.place(mnemonic, 0, rs1, rs2, pc + 4 - self.iss.pc)
+            return True
+        regs = self.iss.regs
+        condition = BRANCH_OPS[INSTRUCTION_SET[mnemonic][2]]
+        if condition(regs[rs1], regs[rs2]) != taken:
+            self.set_register(rs1, operands[0])
+            self.set_register(rs2, operands[1])
+        pc = self.iss.pc
+        if taken:
+            target = self.free_run(pc + 8, 1, pc + 32)
+            if target is None:
+                taken = False
+                if condition(regs[rs1], regs[rs2]):
+                    return self.emit_register("add")
+            else:
+                self.place(mnemonic, 0, rs1, rs2, target - pc)
+                return True
+        if sign == "neg" and pc > 0:
+            imm = -4 * self.rng.randint(1, min(8, pc // 4))
+        elif sign == "zero":
+            imm = 0
+        else:
+            imm = 4 * self.rng.randint(1, 8)
+        self.place(mnemonic, 0, rs1, rs2, imm)
+        return True
+
+    def emit_jal(self, mnemonic):
+        if not self.ensure(2):
+            return False
+        pc = self.iss.pc
+        rd = self.pick_register("rd")
+        if self.pick_sign("J") == "neg":
+            trampoline = self.free_run(pc + 8, 2)
+            if trampoline is not None:
+                self.place("jal", 0, imm=trampoline - pc)
+                self.place("jal", rd, imm=pc + 4 - trampoline)
+                return True
+        target = self.free_run(pc + 4, 1, pc + 28)
+        if target is None:
+            return self.emit_register("add")
+        self.place("jal", rd, imm=target - pc)
+        return True
+
+    def emit_jalr(self, mnemonic):
+        if not self.ensure(2):
+            return False
+        pc = self.iss.pc
+        target = self.free_run(pc + 8, 1, pc + 32)
+        if target is None:
+            return self.emit_register("add")
+        rd, rs1 = self.pick_register("rd"), self.pick_register("rs1")
+        sign = self.pick_sign("I")
+        if rs1 == 0:
+            imm = target
+        else:
+            if sign == "neg":
+                imm = self.rng.randint(max(-2048, target - 2047), -1)
+            elif sign == "pos":
+                imm = self.rng.randint(1, min(2047, target + 2048))
+            else:
+                imm = 0
+            self.set_register(rs1, target - imm)
+        self.place("jalr", rd, rs1, imm=imm)
+        return True
+
+    def emit_upper(self, mnemonic):
+        if not self.ensure(1):
+            return False
+        sign = self.pick_sign("U")
+        if sign == "neg":
+            imm = self.rng.randint(0x80000, 0xFFFFF)
+        elif sign == "pos":
+            imm = self.rng.randint(1, 0x7FFFF)
+        else:
+            imm = 0
+        self.place(mnemonic, self.pick_register("rd"), imm=imm)
+        return True
+
+    EMITTERS = {"R": emit_register, "I": emit_immediate, "IS": emit_immediate, "S": emit_memory,
+                "B": emit_branch, "J": emit_jal, "U": emit_upper}
+
+    def emitter(self, mnemonic):
+        fmt, opcode = INSTRUCTION_SET[mnemonic][:2]
+        if opcode == 0x03:
+            return RandomProgramGenerator.emit_memory
+        if opcode == 0x67:
+            return RandomProgramGenerator.emit_jalr
+        return self.EMITTERS[fmt]
+
+    # ------------------------------------------------------------ generation
+
+    def generate(self, length=200):
+        """
+        Generates one program that executes about `length` instructions and ends in a
+        "jal x0, 0" self loop.
+
+        :return: The list of instruction words of the image.
+        """
+        self.program = DecodedProgram(bytearray(self.program_size))
+        self.iss = RISCV_ISS(self.program, self.memory_size)
+        self.used = [False] * (self.program_size // 4)
+        self.executed = 0
+        mnemonics = list(INSTRUCTION_SET)
+        while self.executed < length:
+            mnemonic = self.weighted(mnemonics, lambda name: self.coverage.kinds[name])
+            if not self.emitter(mnemonic)(self, mnemonic):
+                break
+        # The cursor slot is always free, end with a self loop (spin detection stops the run)
+        self.place("jal", 0, imm=0)
+        last = max(index for index, used in enumerate(self.used) if used)
+        return [int.from_bytes(self.program.image[4 * i : 4 * i + 4], 'little') if self.used[i] else NOP
+                for i in range(last + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate random RV32I programs with coverage feedback")
+    parser.add_argument("--out", default="random_tests", help="output directory of the hex images")
+    parser.add_argument("--programs", type=int, default=10, help="maximum number of programs")
+    parser.add_argument("--length", type=int, default=200, help="executed instructions per program")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--until-full", action="store_true", help="stop as soon as every bin is hit")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    generator = RandomProgramGenerator(rng=random.Random(args.seed))
+    for n in range(args.programs):
+        words = generator.generate(args.length)
+        write_hex_image(os.path.join(args.out, "random_%04d.hex" % n), words)
+        print("random_%04d.hex: %d instructions, coverage %.1f%%" % (n, len(words), generator.coverage.percent()))
+        if args.until_full and not generator.coverage.missing():
+            break
+    with open(os.path.join(args.out, "coverage.json"), 'w') as file:
+        json.dump(generator.coverage.to_dict(), file, indent=2)
+    missing = generator.coverage.missing()
+    if missing:
+        print("Missing bins: " + ", ".join(missing))
+
+
+if __name__ == "__main__":
+    main()
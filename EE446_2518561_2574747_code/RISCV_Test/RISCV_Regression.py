@@ -0,0 +1,152 @@
+# RISCV_Regression.py
+#
+# Runs RISCV_Computer_Test on every instruction image of a directory, in parallel.
+# Assembly sources (*.s, *.asm) are assembled first, through the assembler cache.
+# The HDL is compiled once (or taken from RISCV_Build_Cache), every run gets its own
+# directory with a copy of the compiled sim_build, and the per-run results.xml
+# files are merged into one report:
+#
+#   python RISCV_Regression.py tests/ -j 8 --seeds 1 2 3
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from RISCV_Assembler import AssemblerError, AssemblyCache
+from RISCV_Build_Cache import SIM_ARTIFACTS, STAMP
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+MAKEFILE = os.path.join(TEST_DIR, "Makefile")
+
+def find_images(directory):
+    """
+    Returns the sorted list of *.hex images and *.s/*.asm sources below `directory`.
+    """
+    return sorted(path for pattern in ("*.hex", "*.s", "*.asm")
+                  for path in glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+
+
+def make_command(sim, sim_build, *arguments):
+    return ["make", "-f", MAKEFILE, "SIM=" + sim, "SIM_BUILD=" + sim_build] + list(arguments)
+
+
+def build(sim, sim_build):
+    """
+    Compiles the HDL into `sim_build` without running a simulation, or restores
+    it from the build cache if the same HDL and flags were compiled before.
+    """
+    os.makedirs(sim_build, exist_ok=True)
+    target = os.path.join(sim_build, SIM_ARTIFACTS[sim][0])
+    subprocess.run(make_command(sim, sim_build, target), cwd=TEST_DIR, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def run_one(job):
+    """
+    Runs one simulation in its own directory. Executed in a worker process.
+
+    :param job: (run name, image, seed, simulator, shared sim_build, run directory)
+    :return: (run name, passed, wall time, results file)
+    """
+    name, image, seed, sim, shared_build, run_dir = job
+    if os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+    sim_build = os.path.join(run_dir, "sim_build")
+    os.makedirs(sim_build)
+    # copy2 keeps the timestamps, so make sees the copied build as up to date,
+    # the stamp tells the build cache which build it is
+    for artifact in SIM_ARTIFACTS[sim] + [STAMP]:
+        shutil.copy2(os.path.join(shared_build, artifact), sim_build)
+    results = os.path.join(run_dir, "results.xml")
+    env = dict(os.environ, RANDOM_SEED=str(seed))
+    start = time.perf_counter()
+    with open(os.path.join(run_dir, "sim.log"), "w") as log:
+        returncode = subprocess.run(
+            make_command(sim, sim_build, "PROGRAM=" + os.path.abspath(image), "COCOTB_RESULTS_FILE=" + results),
+            cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+    # cocotb does not fail make on a failing test, the results file has to be checked
+    passed = (returncode == 0 and os.path.exists(results)
+              and ET.parse(results).getroot().find("testsuite/testcase/failure") is None)
+    return name, passed, time.perf_counter() - start, results
+
+
+def merge_results(runs, report):
+    """
+    Merges the results.xml of every run into a single report, one testsuite per run.
+
+    :return: The number of failed runs.
+    """
+    root = ET.Element("testsuites", name="regression")
+    failed = 0
+    for name, passed, elapsed, results in runs:
+        suites = []
+        if os.path.exists(results):
+            suites = ET.parse(results).getroot().findall("testsuite")
+        if not suites:
+            suite = ET.Element("testsuite", name=name)
+            case = ET.SubElement(suite, "testcase", name=name, time=str(elapsed))
+            ET.SubElement(case, "failure", message="simulation did not write results, see sim.log")
+            suites = [suite]
+        for suite in suites:
+            suite.set("name", name)
+            root.append(suite)
+        failed += not passed
+    ET.ElementTree(root).write(report)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the testbench on a directory of instruction images")
+    parser.add_argument("directory", help="directory searched recursively for *.hex images and *.s/*.asm sources")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="parallel simulations")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="RANDOM_SEED values, every image runs once per seed")
+    parser.add_argument("--sim", default=os.environ.get("SIM", "icarus"), choices=sorted(SIM_ARTIFACTS))
+    parser.add_argument("--out", default="regression_runs", help="directory of the run directories")
+    parser.add_argument("--report", default="regression_results.xml", help="merged JUnit report")
+    args = parser.parse_args()
+
+    images = find_images(args.directory)
+    if not images:
+        sys.exit("No *.hex images or assembly sources found in " + args.directory)
+    # Assembled once here instead of in every run, unchanged sources come from the cache
+    cache = AssemblyCache()
+    try:
+        programs = [(image, cache.image(image)) for image in images]
+    except AssemblerError as error:
+        sys.exit(str(error))
+    if cache.hits or cache.misses:
+        print("Assembled %d sources, %d from the cache" % (cache.hits + cache.misses, cache.hits))
+    out = os.path.abspath(args.out)
+    shared_build = os.path.join(out, "sim_build")
+
+    start = time.perf_counter()
+    build(args.sim, shared_build)
+    print("Compiled HDL in %.1f s" % (time.perf_counter() - start))
+
+    jobs = []
+    for source, image in programs:
+        stem = os.path.splitext(os.path.relpath(source, args.directory))[0].replace(os.sep, "_")
+        for seed in args.seeds:
+            name = "%s_seed%d" % (stem, seed)
+            jobs.append((name, image, seed, args.sim, shared_build, os.path.join(out, "runs", name)))
+
+    runs = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for run in pool.map(run_one, jobs):
+            name, passed, elapsed, results = run
+            print("%-40s %s %6.1f s" % (name, "PASS" if passed else "FAIL", elapsed))
+            runs.append(run)
+
+    failed = merge_results(runs, args.report)
+    print("%d runs, %d failed, %.1f s wall time, report written to %s"
+          % (len(runs), failed, time.perf_counter() - start, args.report))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
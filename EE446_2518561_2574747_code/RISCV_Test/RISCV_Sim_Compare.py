@@ -0,0 +1,106 @@
+# RISCV_Sim_Compare.py
+#
+# Builds and runs RISCV_Computer_Test on several simulators with the same program
+# and cycle budget, and reports build time, simulated cycles per wall-second and
+# peak memory of each backend:
+#
+#   python RISCV_Sim_Compare.py --program Instructions.hex --cycles 20000 --sims icarus verilator
+#
+# Untested: the Verilator build and this comparison have not been run on real
+# simulators yet, only the generated make commands were checked.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+import xml.etree.ElementTree as ET
+from RISCV_Regression import SIM_ARTIFACTS, make_command
+from RISCV_Computer_Test import CLOCK_PERIOD_NS
+
+
+def run_measured(command, cwd, env, log):
+    """
+    Runs `command` and measures it including all the processes it starts.
+
+    :return: (return code, wall time in seconds, peak resident memory in MiB)
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    # wait4 reports the largest maxrss of the process and its waited-for children
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, time.perf_counter() - start, usage.ru_maxrss / 1024
+
+
+def measure(sim, program, cycles, check_mode, out):
+    """
+    Builds the HDL from scratch with `sim` and runs `program` for `cycles` clock cycles.
+
+    :return: A dict of measurements, "error" is set if a phase failed.
+    """
+    run_dir = os.path.join(out, sim)
+    if os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+    sim_build = os.path.join(run_dir, "sim_build")
+    os.makedirs(sim_build)
+    results = os.path.join(run_dir, "results.xml")
+    # No early termination, every backend simulates the same number of cycles.
+    # The build cache is off, the build time is part of the comparison.
+    env = dict(os.environ, BUILD_CACHE="0", RISCV_MAX_CYCLES=str(cycles), RISCV_HALT_ON_SPIN="0",
+               RISCV_HALT_WORDS="", RISCV_CHECK_MODE=check_mode, RISCV_TRACE_LEVEL="off")
+    report = {"sim": sim, "cycles": 0}
+
+    with open(os.path.join(run_dir, "build.log"), "w") as log:
+        target = os.path.join(sim_build, SIM_ARTIFACTS[sim][0])
+        returncode, report["build_time"], report["build_memory_mb"] = run_measured(
+            make_command(sim, sim_build, target), run_dir, env, log)
+    if returncode:
+        report["error"] = "build failed, see " + log.name
+        return report
+
+    with open(os.path.join(run_dir, "sim.log"), "w") as log:
+        returncode, report["run_time"], report["run_memory_mb"] = run_measured(
+            make_command(sim, sim_build, "PROGRAM=" + os.path.abspath(program), "COCOTB_RESULTS_FILE=" + results),
+            run_dir, env, log)
+    if returncode or not os.path.exists(results):
+        report["error"] = "simulation failed, see " + log.name
+        return report
+
+    case = ET.parse(results).getroot().find("testsuite/testcase")
+    if case.find("failure") is not None:
+        report["error"] = "test failed, see " + log.name
+    # Simulated time is the only backend independent measure of the work done
+    report["cycles"] = int(float(case.get("sim_time_ns", 0)) // CLOCK_PERIOD_NS)
+    report["test_time"] = float(case.get("time", 0))
+    report["cycles_per_second"] = report["cycles"] / report["run_time"] if report["run_time"] else 0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the simulation throughput of the HDL backends")
+    parser.add_argument("--program", default="Instructions.hex", help="instruction image run on every backend")
+    parser.add_argument("--cycles", type=int, default=20000, help="clock cycles simulated per backend")
+    parser.add_argument("--sims", nargs="+", default=sorted(SIM_ARTIFACTS), choices=sorted(SIM_ARTIFACTS))
+    parser.add_argument("--check-mode", default="batch", choices=["batch", "lockstep"], help="testbench checking mode")
+    parser.add_argument("--out", default="sim_compare", help="directory of the build and run directories")
+    parser.add_argument("--json", help="also write the measurements to this file")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out)
+    reports = [measure(sim, args.program, args.cycles, args.check_mode, out) for sim in args.sims]
+
+    print("%-10s %10s %10s %10s %12s %10s %10s" % ("sim", "build [s]", "build MiB", "cycles", "cycles/s", "run [s]", "run MiB"))
+    for report in reports:
+        print("%-10s %10.1f %10.0f %10d %12.0f %10.1f %10.0f  %s" % (
+            report["sim"], report.get("build_time", 0), report.get("build_memory_mb", 0), report["cycles"],
+            report.get("cycles_per_second", 0), report.get("run_time", 0), report.get("run_memory_mb", 0),
+            report.get("error", "")))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# RISCV_UART_Test.py
+#
+# Byte-stream test of the UART path (UART_Receiver -> UART_FIFO -> LW 0x404 ->
+# SB 0x400 -> UART_Transmitter) with the uart_echo.hex firmware. Use a shortened
+# bit time, every byte costs 10 bit times on rx and again on tx:
+#
+#   make uart UART_BYTES=512
+
+import random
+import cocotb
+from cocotb.triggers import FallingEdge, RisingEdge
+from Helper_Config import TestConfig
+from Helper_UART import stream
+from RISCV_Computer_Test import CLOCK_PERIOD_NS, start_computer
+
+
+@cocotb.test()
+async def UART_Echo_Test(dut):
+    config = TestConfig.load()
+    uart_rx, uart_tx = await start_computer(dut, config)
+    #The echo loop polls the FIFO every 3 cycles, the idle bits keep the
+    #transmitter ahead of the receiver when the bit time is only a few cycles
+    uart_rx.idle_bits = 4
+    dut.reset.value=1
+    await RisingEdge(dut.clk)
+    dut.reset.value=0
+    await FallingEdge(dut.clk)
+
+    #random is seeded from RANDOM_SEED by cocotb
+    length = int(cocotb.plusargs.get('uart_bytes', 256))
+    data = bytes(random.getrandbits(8) for _ in range(length))
+    frame_ns = (10 + uart_rx.idle_bits) * uart_rx.bit_time_ns
+    timeout_ns = (length + 2) * frame_ns + 100 * CLOCK_PERIOD_NS
+    received = await stream(uart_rx, uart_tx, data, timeout=timeout_ns, units='ns')
+
+    assert uart_tx.framing_errors == 0, "%d framing errors on tx" % uart_tx.framing_errors
+    for i, (sent, echoed) in enumerate(zip(data, received)):
+        assert sent == echoed, "Byte %d: sent 0x%02x, echoed 0x%02x" % (i, sent, echoed)
+    dut._log.info("Echoed %d bytes in %d clock cycles", length,
+                  cocotb.utils.get_sim_time('ns') // CLOCK_PERIOD_NS)
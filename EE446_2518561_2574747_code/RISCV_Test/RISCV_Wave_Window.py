@@ -0,0 +1,119 @@
+# RISCV_Wave_Window.py
+#
+# Waveforms of the cycles before a failure, without dumping the whole run. The
+# program first runs without any dump. If the testbench reports a mismatch, it is
+# simulated again with Wave_Window.v recording only the chosen scopes for the last
+# --window cycles up to the mismatch:
+#
+#   python RISCV_Wave_Window.py --program long_test.hex --window 64 --scopes datapath controller
+#
+# By default the second run rewinds instead of starting over: the model fast-forwards
+# to the start of the window and the DUT state is loaded through the backdoor, so only
+# the window itself is simulated. State outside the architectural registers and memory
+# (UART, pipeline registers) is not loaded, if the mismatch does not show up again at
+# the same cycle the run is repeated from reset (--no-rewind does that right away).
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from Helper_Config import TestConfig
+from RISCV_Regression import make_command
+
+#Scopes Wave_Window.v can record, see its +wave_<scope> options
+WAVE_SCOPES = ["top", "controller", "datapath", "rf", "alu", "uart"]
+
+
+def run(name, program, out, sim_build, environment, arguments):
+    """
+    Runs RISCV_Computer_Test with the Wave_Window build in out/<name>.
+
+    :return: (mismatch report or None, passed, run directory)
+    """
+    run_dir = os.path.join(out, name)
+    if os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+    os.makedirs(run_dir)
+    report_file = os.path.join(run_dir, "mismatch.json")
+    results = os.path.join(run_dir, "results.xml")
+    env = dict(os.environ, RISCV_MISMATCH_REPORT=report_file, **environment)
+    with open(os.path.join(run_dir, "sim.log"), "w") as log:
+        subprocess.run(make_command("icarus", sim_build, "WAVE_WINDOW=1", "PROGRAM=" + program,
+                                    "COCOTB_RESULTS_FILE=" + results, *arguments),
+                       cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    report = None
+    if os.path.exists(report_file):
+        with open(report_file) as file:
+            report = json.load(file)
+    passed = os.path.exists(results) and ET.parse(results).getroot().find("testsuite/testcase/failure") is None
+    return report, passed, run_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump the waveforms of the cycles before a mismatch")
+    parser.add_argument("--program", default="Instructions.hex", help="instruction image or assembly source")
+    parser.add_argument("--window", type=int, default=64, help="cycles recorded up to the mismatch")
+    parser.add_argument("--scopes", nargs="+", default=["datapath", "controller"], choices=WAVE_SCOPES)
+    parser.add_argument("--format", default="fst", choices=["fst", "vcd"])
+    parser.add_argument("--no-rewind", action="store_true", help="repeat the run from reset instead of fast-forwarding")
+    parser.add_argument("--out", default="wave_runs", help="directory of the run directories")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out)
+    os.makedirs(out, exist_ok=True)
+    program = os.path.abspath(args.program)
+    # Both runs use the same build, the second one finds it up to date
+    sim_build = os.path.join(out, "sim_build")
+    wave_file = os.path.join(out, "window." + args.format)
+    scopes = "WAVE_SCOPES=" + " ".join(args.scopes)
+    if os.path.exists(wave_file):
+        os.remove(wave_file)
+
+    start = time.perf_counter()
+    report, passed, run_dir = run("detect", program, out, sim_build, {}, [])
+    print("Detection run: %.1f s" % (time.perf_counter() - start))
+    if report is None:
+        if passed:
+            print("No mismatch, nothing recorded")
+            return
+        sys.exit("The test failed without a mismatch report, see " + os.path.join(run_dir, "sim.log"))
+    print("Mismatch at clock cycle %d, PC:0x%x (DUT PC:%s)" % (report["cycle"], report["pc"], report["dut_pc"]))
+
+    recorded = None
+    config = TestConfig.load()
+    window_start = report["cycle"] - args.window
+    # Rewinding only helps if the window starts after the point the first run started from
+    if not args.no_rewind and window_start > config.fast_forward:
+        start = time.perf_counter()
+        rewound, _, run_dir = run("rewind", program, out, sim_build,
+                                  {"RISCV_FAST_FORWARD": str(window_start)},
+                                  [scopes, "WAVE_START=0", "WAVE_CYCLES=%d" % (args.window + 1),
+                                   "WAVE_FILE=" + wave_file])
+        print("Rewound run from cycle %d: %.1f s" % (window_start, time.perf_counter() - start))
+        if rewound is not None and rewound["cycle"] == report["cycle"]:
+            recorded = window_start
+        else:
+            print("The mismatch did not show up again at cycle %d after rewinding, repeating the run from reset"
+                  % report["cycle"])
+
+    if recorded is None:
+        hdl_start = max(0, report["hdl_cycle"] - args.window)
+        start = time.perf_counter()
+        run("window", program, out, sim_build, {},
+            [scopes, "WAVE_START=%d" % hdl_start, "WAVE_CYCLES=%d" % (report["hdl_cycle"] - hdl_start + 1),
+             "WAVE_FILE=" + wave_file])
+        print("Windowed run: %.1f s" % (time.perf_counter() - start))
+        recorded = report["cycle"] - (report["hdl_cycle"] - hdl_start)
+
+    if not os.path.exists(wave_file):
+        sys.exit("No waveform was written, see the sim.log files in " + out)
+    print("Cycles %d to %d (%s) written to %s" % (recorded, report["cycle"], ", ".join(args.scopes), wave_file))
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+// Windowed waveform dump of RISCV_Computer, compiled in as a second root module
+// with "make WAVE_WINDOW=1" (icarus). Nothing is recorded unless +wave_start is
+// given, then the dump is on from clk cycle wave_start for wave_cycles cycles.
+// Cycles count the rising clk edges after reset, as the testbench does.
+//
+//   +wave_start=<cycle>   first cycle of the window, 0 = from reset
+//   +wave_cycles=<n>      length of the window (default 64)
+//   +wave_file=<file>     dump file, FST with the vvp option -fst (default window.vcd)
+//   +wave_<scope>         scopes recorded: top (toplevel ports), controller, datapath,
+//                         rf, alu, uart; datapath if none is given
+module Wave_Window;
+
+reg [8*256-1:0] wave_file;
+integer wave_start;
+integer wave_cycles;
+integer cycle;
+reg enabled;
+reg scoped;
+
+initial begin
+  cycle = 0;
+  enabled = $value$plusargs("wave_start=%d", wave_start);
+  if (!$value$plusargs("wave_cycles=%d", wave_cycles))
+    wave_cycles = 64;
+  if (!$value$plusargs("wave_file=%s", wave_file))
+    wave_file = "window.vcd";
+  if (enabled) begin
+    $dumpfile(wave_file);
+    scoped = 0;
+    if ($test$plusargs("wave_top")) begin
+      $dumpvars(1, RISCV_Computer);
+      scoped = 1;
+    end
+    if ($test$plusargs("wave_controller")) begin
+      $dumpvars(0, RISCV_Computer.controller);
+      scoped = 1;
+    end
+    if ($test$plusargs("wave_datapath")) begin
+      $dumpvars(0, RISCV_Computer.datapath);
+      scoped = 1;
+    end
+    if ($test$plusargs("wave_rf")) begin
+      $dumpvars(0, RISCV_Computer.datapath.rf);
+      scoped = 1;
+    end
+    if ($test$plusargs("wave_alu")) begin
+      $dumpvars(0, RISCV_Computer.datapath.alu_unit);
+      scoped = 1;
+    end
+    if ($test$plusargs("wave_uart")) begin
+      $dumpvars(0, RISCV_Computer.datapath.receiver_inst);
+      $dumpvars(0, RISCV_Computer.datapath.fifo_inst);
+      $dumpvars(0, RISCV_Computer.datapath.transmitter_inst);
+      scoped = 1;
+    end
+    if (!scoped)
+      $dumpvars(0, RISCV_Computer.datapath);
+    // $dumpvars records the initial values, keep them only for a window from reset
+    if (wave_start > 0)
+      $dumpoff;
+  end
+end
+
+always @(posedge RISCV_Computer.clk) begin
+  if (enabled && !RISCV_Computer.reset) begin
+    cycle = cycle + 1;
+    if (cycle == wave_start && wave_start > 0)
+      $dumpon;
+    if (cycle == wave_start + wave_cycles) begin
+      $dumpoff;
+      $dumpflush;
+    end
+  end
+end
+
+endmodule
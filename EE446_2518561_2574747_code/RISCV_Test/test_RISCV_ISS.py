@@ -0,0 +1,27 @@
+# test_RISCV_ISS.py
+#
+# Regression checks of the instruction set simulator that need no HDL simulator:
+#
+#   python -m pytest test_RISCV_ISS.py
+
+import os
+import pytest
+import Helper_Config
+from Helper_Devices import UART_FUNCTIONAL, UART_CYCLE
+from RISCV_ISS import RISCV_ISS
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.parametrize("uart_mode", [UART_FUNCTIONAL, UART_CYCLE])
+def test_sample_program_halts_in_uart_loop(uart_mode):
+    # Instructions.hex ends in a beq x0,x0 loop that only sends bytes on the UART,
+    # the spin detection has to stop it long before the cycle budget
+    config = Helper_Config.TestConfig(uart_mode=uart_mode)
+    iss = RISCV_ISS.from_hex_file(os.path.join(TEST_DIR, "Instructions.hex"), config.memory_size)
+    iss.configure(config)
+    executed = iss.run(config.max_cycles)
+    assert iss.halted, "ran the whole budget of %d cycles" % config.max_cycles
+    assert iss.halt_reason.startswith("spin loop")
+    assert executed < 200
+    assert iss.uart.transmitted.startswith(b"e")